@@ -1,20 +1,123 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 import streamlit as st
-from io import BytesIO
+from app_resources import get_process_pool
+from excel_export import DOWNLOAD_FORMATS, XLSX_MIME, download_file_name, download_options, table_download, write_excel
+from instrumentation import activate, bind, for_file, profile_options, show_profile_panel, stage
+from learning_trail import render_trail_chart_png, segment_trail
+from pdf_cache import content_hash
+from trail_batch import build_trail_zip, iter_students, read_concept_levels
+
+# Learning trail of an uploaded workbook, read once per upload (cached by its content hash)
+@st.cache_data(max_entries=8)
+def load_trail(upload_hash, _upload):
+    return pd.read_excel(_upload, sheet_name=0)  # sheet_name=0 loads the first/only sheet automatically
+
+# Students of the uploaded batch workbooks, read once per set of uploads (cached by their
+# names and content hashes, as a workbook with one sheet is named after its file)
+@st.cache_data(max_entries=4)
+def load_students(upload_keys, _trail_files):
+    return list(iter_students((trail_file.name, trail_file) for trail_file in _trail_files))
+
+# Merged and sorted trail, concept level table and both workbooks for one vector of concept
+# levels, so only a real change of the levels recomputes them
+@st.cache_data(max_entries=32)
+def trail_outputs(upload_hash, levels, _trail_df):
+    concepts_df = pd.DataFrame(list(levels), columns=['Concept', 'Concept Level'])
+    with stage("merge/sort"):
+        # Merge the user-provided concept levels back into the main DataFrame
+        merged_df = pd.merge(_trail_df, concepts_df, left_on='Cluster', right_on='Concept', how='left')
+
+        # Sort the DataFrame by Question_Number to ensure a continuous line
+        merged_df = merged_df.sort_values(by='Question_Number')
+
+    # Build the progressive table with start and end question numbers
+    with stage("segment"):
+        table_df = segment_trail(merged_df)
+
+    # Save both tables as Excel files in memory
+    concepts_excel = write_excel({'Concept Levels': concepts_df})
+    table_excel = write_excel({'Concept Level Table': table_df})
+    return concepts_df, merged_df, table_df, concepts_excel, table_excel
+
+# PNG of the learning trail chart for one vector of concept levels and one title
+@st.cache_data(max_entries=32)
+def trail_chart_png(upload_hash, levels, title, _merged_df):
+    with stage("chart"):
+        return render_trail_chart_png(
+            _merged_df['Question_Number'].to_numpy(),
+            _merged_df['Concept Level'].to_numpy(),
+            _merged_df['Mode'].to_numpy(),
+            title,
+        )
 
 # Streamlit app title
 st.title("Learning Journey of Students")
 
+# Build the learning trails of a whole class at once instead of one student at a time
+batch_mode = st.sidebar.checkbox("Batch mode: many students at once")
+
+if batch_mode:
+    trail_files = st.file_uploader(
+        "Upload learning trail workbooks: one workbook with a sheet per student, or one workbook per student",
+        type="xlsx", accept_multiple_files=True
+    )
+    levels_file = st.file_uploader("Upload the concept levels (the Concept Levels workbook this tool downloads), or enter them below", type="xlsx")
+
+    if trail_files:
+        # Every sheet is read with a streaming read-only reader, once per set of uploads
+        upload_keys = tuple((trail_file.name, content_hash(trail_file.getbuffer())) for trail_file in trail_files)
+        students = load_students(upload_keys, trail_files)
+        st.write(f"{len(students)} students found.")
+
+        # The levels are entered in a form, so typing them does not rerun the page
+        with st.form("batch_levels"):
+            if levels_file is not None:
+                concept_levels = read_concept_levels(levels_file)
+            else:
+                # One level per concept, shared by every student
+                concept_levels = {}
+                st.write("Enter the levels for the following concepts:")
+                all_concepts = pd.unique(pd.concat([trail_df['Cluster'] for _, trail_df in students], ignore_index=True))
+                for concept in all_concepts:
+                    concept_levels[concept] = st.number_input(f"Level for '{concept}':", min_value=-1000, max_value=1000, value=0, step=1, format="%d")
+            build = st.form_submit_button(f"Build the learning trails of {len(students)} students")
+
+        # The ZIP is kept for this set of workbooks and levels until either changes
+        batch_key = (upload_keys, tuple(concept_levels.items()))
+        if build:
+            progress = st.progress(0.0, text="Building learning trails...")
+            pool = get_process_pool()
+            st.session_state["trail_zip"] = batch_key, *build_trail_zip(
+                students, concept_levels, pool=pool,
+                progress=lambda done, student: progress.progress(done / len(students), text=f"Built {done} of {len(students)}: {student}")
+            )
+
+        zip_key, zip_data, failures = st.session_state.get("trail_zip", (None, None, None))
+        if zip_key == batch_key:
+            if failures:
+                st.warning(
+                    f"{len(failures)} students were left out (listed in errors.txt in the ZIP):\n"
+                    + "\n".join(f"- {student}: {error}" for student, error in failures)
+                )
+            st.download_button(
+                label="Download all charts and tables as ZIP",
+                data=zip_data,
+                file_name="learning_trails.zip",
+                mime="application/zip"
+            )
+    st.stop()
+
 # File uploader
 uploaded_file = st.file_uploader("Upload your Excel file", type="xlsx")
+download_format, _ = download_options("Download format of the table", several_tables=False)
+# Wall time (and allocations) of each stage, shown below the results
+profile = profile_options("app_casestudy")
 
 if uploaded_file is not None:
-    # Prompt for the student's name
-    student_name = st.text_input("Enter the student's name:")
-
-    # Automatically load the only sheet available in the uploaded file
-    copy_trail_df = pd.read_excel(uploaded_file, sheet_name=0)  # sheet_name=0 loads the first/only sheet automatically
+    # The workbook is only parsed again when a different file is uploaded
+    upload_hash = content_hash(uploaded_file.getbuffer())
+    with activate(profile), for_file(uploaded_file.name), stage("read_excel"):
+        copy_trail_df = load_trail(upload_hash, uploaded_file)
     
     # Extract unique topics and set the first one as the default topic for the chart
     topics = copy_trail_df['Topic'].unique()
@@ -28,163 +131,61 @@ if uploaded_file is not None:
     # Dictionary to store user inputs for concept levels
     concept_levels = {}
 
-    st.write("Enter the levels for the following concepts:")
-    for concept in unique_concepts:
-        # Get user input for each concept level (integer values only)
-        level = st.number_input(f"Level for '{concept}':", min_value=-1000, max_value=1000, value=0, step=1, format="%d")
-        concept_levels[concept] = level
+    # The name and levels are applied together on submit, not after every keystroke
+    with st.form("concept_levels"):
+        # Prompt for the student's name
+        student_name = st.text_input("Enter the student's name:")
+
+        st.write("Enter the levels for the following concepts:")
+        for concept in unique_concepts:
+            # Get user input for each concept level (integer values only)
+            level = st.number_input(f"Level for '{concept}':", min_value=-1000, max_value=1000, value=0, step=1, format="%d")
+            concept_levels[concept] = level
 
-    # Convert the dictionary to a DataFrame
-    concepts_df = pd.DataFrame(list(concept_levels.items()), columns=['Concept', 'Concept Level'])
+        st.form_submit_button("Apply")
+
+    levels = tuple(concept_levels.items())
+    with activate(profile), for_file(uploaded_file.name):
+        concepts_df, merged_df, table_df, concepts_excel, table_excel = trail_outputs(upload_hash, levels, copy_trail_df)
 
     # Display the table of concepts and levels entered by the user
     st.write("Concept Levels Entered by User:")
     st.dataframe(concepts_df)
 
-    # Save the concepts DataFrame as an Excel file in a BytesIO object
-    concepts_excel_buf = BytesIO()
-    with pd.ExcelWriter(concepts_excel_buf, engine='openpyxl') as writer:
-        concepts_df.to_excel(writer, index=False, sheet_name='Concept Levels')
-    concepts_excel_buf.seek(0)
-
     # Provide a download button for the Concept Levels Excel file
     st.download_button(
         label="Download Concept Levels as Excel",
-        data=concepts_excel_buf,
+        data=concepts_excel,
         file_name="concept_levels.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        mime=XLSX_MIME
     )
 
-    # Merge the user-provided concept levels back into the main DataFrame
-    merged_df = pd.merge(copy_trail_df, concepts_df, left_on='Cluster', right_on='Concept', how='left')
-
-    # Sort the DataFrame by Question_Number to ensure a continuous line
-    merged_df = merged_df.sort_values(by='Question_Number')
-
-    # Extract unique question numbers and corresponding concept levels and modes
-    question_numbers = merged_df['Question_Number'].values
-    concept_levels = merged_df['Concept Level'].values
-    modes = merged_df['Mode'].values
-
     # Create the plot
-    fig, ax = plt.subplots(figsize=(10, 6))
     if student_name:
         chart_title = f"Learning trail of {student_name} - {topic}"
     else:
         chart_title = f"Learning trail - {topic}"
-    ax.set_title(chart_title)
-    ax.set_xlabel('Question Number')
-    ax.set_ylabel('Concept Level')
-    ax.yaxis.get_major_locator().set_params(integer=True)
-
-    # Set the x-axis limits based on the question number range
-    ax.set_xlim([question_numbers.min(), question_numbers.max()])
-
-    # Extend the y-axis limits based on the concept levels (adding padding) and set the major unit to 1
-    ax.set_ylim([concept_levels.min() - 1, concept_levels.max() + 1])
-    ax.yaxis.set_major_locator(plt.MultipleLocator(1))
-
-    # Add gridlines to the plot
-    ax.grid(True)
-
-    # Plot a smooth line for concept levels and change color segments based on mode
-    for i in range(1, len(question_numbers)):
-        color = 'green' if modes[i] == 'Learn' else 'red' if modes[i] == 'Remediation' else 'blue'
-        ax.plot(question_numbers[i-1:i+1], concept_levels[i-1:i+1], color=color, linestyle='-')
-
-        # For "Challenge" mode, add markers
-        if modes[i] == 'Challenge':
-            ax.scatter(question_numbers[i], concept_levels[i], color='blue', marker='^', s=100)
-
-    # Adding legend manually for all modes
-    ax.plot([], [], color='green', label='Learn')
-    ax.plot([], [], color='red', label='Remediation')
-    ax.scatter([], [], color='blue', marker='^', s=100, label='Challenge')
-
-    ax.legend()
-    st.pyplot(fig)
-
-    # Save the figure to a BytesIO object for download
-    buf = BytesIO()
-    fig.savefig(buf, format='png')
-    buf.seek(0)
+    with activate(profile), for_file(uploaded_file.name):
+        chart_png = trail_chart_png(upload_hash, levels, chart_title, merged_df)
+    st.image(chart_png)
 
     # Provide a download button for the figure
     st.download_button(
         label="Download Plot",
-        data=buf,
+        data=chart_png,
         file_name="concept_level_analysis.png",
         mime="image/png"
     )
 
-    # Step 4: Build the progressive table with start and end question numbers
-    table_data = []
-    previous_mode = None
-    start_question_number = None
-    start_concept_level = None
-
-    for i, (index, row) in enumerate(merged_df.iterrows()):
-        current_mode = row['Mode']
-        current_question_number = row['Question_Number']
-        cluster = row['Cluster']
-        concept_level = row['Concept Level']
-
-        # Dynamically filter the correctness values for this row
-        correctness = merged_df[(merged_df['Cluster'] == cluster) & (merged_df['Mode'] == current_mode) & (merged_df['Question_Number'] == current_question_number)]['Correctness'].values
-
-        if previous_mode is None or current_mode != previous_mode or start_concept_level is None or concept_level != start_concept_level:
-            # New mode or concept level change detected or first entry
-            if start_question_number is not None:
-                # Finalize the previous row
-                table_data[-1]['End Question Number'] = merged_df.iloc[i-1]['Question_Number']
-                table_data[-1]['Number of Questions'] = table_data[-1]['End Question Number'] - table_data[-1]['Start Question Number'] + 1
-
-            # Set the start question number and concept level for the new mode/level
-            start_question_number = current_question_number
-            start_concept_level = concept_level
-
-            # Calculate accuracy as a percentage
-            accuracy_percentage = round((correctness.sum() / len(correctness)) * 100, 2) if len(correctness) > 0 else 0
-
-            # Add a new row for the new mode/level
-            table_data.append({
-                'Cluster': cluster,
-                'Concept Level': concept_level,
-                'Mode': current_mode,
-                'Number of Questions': 0,  # Will be filled later
-                'Accuracy (%)': accuracy_percentage,
-                'Start Question Number': start_question_number,
-                'End Question Number': None  # To be filled in the next iteration
-            })
-        else:
-            # Update the previous mode and accuracy dynamically
-            table_data[-1]['Concept Level'] = concept_level
-            if len(correctness) > 0:
-                table_data[-1]['Accuracy (%)'] = round((table_data[-1]['Accuracy (%)'] + (correctness.sum() / len(correctness)) * 100) / 2, 2)
-
-        # Update the previous mode and concept level
-        previous_mode = current_mode
-        start_concept_level = concept_level
-
-    # Finalize the last row's end question number and number of questions
-    if table_data:
-        table_data[-1]['End Question Number'] = merged_df.iloc[-1]['Question_Number']
-        table_data[-1]['Number of Questions'] = table_data[-1]['End Question Number'] - table_data[-1]['Start Question Number'] + 1
-
-    # Convert the list to a DataFrame
-    table_df = pd.DataFrame(table_data)
-
-    # Save the DataFrame as an Excel file in a BytesIO object
-    excel_buf = BytesIO()
-    with pd.ExcelWriter(excel_buf, engine='openpyxl') as writer:
-        table_df.to_excel(writer, index=False, sheet_name='Concept Level Table')
-    excel_buf.seek(0)
-    
     st.write(table_df)
-    # Provide a download button for the Excel file
+    # Provide a download button for the table. The workbook is built with the other outputs;
+    # the other formats only when they are requested
+    file_name, mime = download_file_name("concept_level_table", download_format)
     st.download_button(
-        label="Download Table as Excel",
-        data=excel_buf,
-        file_name="concept_level_table.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        label=f"Download Table as {DOWNLOAD_FORMATS[download_format][0]}",
+        data=table_excel if download_format == "xlsx" else bind(profile, table_download({'Concept Level Table': table_df}, download_format)),
+        file_name=file_name,
+        mime=mime
     )
+
+    show_profile_panel(profile)
@@ -0,0 +1,63 @@
+import streamlit as st
+
+# Resources shared by every page, rerun and session of the apps. They live once per
+# Streamlit process, so the pages of streamlit_app.py use the same caches, store, worker
+# pool and ingest jobs. Each module is imported on the first call, by the first page that
+# needs it.
+
+
+# Cache of parsed PDFs
+@st.cache_resource
+def get_pdf_cache():
+    from pdf_cache import ParsedPDFCache
+
+    return ParsedPDFCache()
+
+
+# Store of the rows extracted from every PDF uploaded so far
+@st.cache_resource
+def get_results_store():
+    from results_store import ResultsStore
+
+    return ResultsStore()
+
+
+@st.cache_resource
+def _process_pool():
+    from tmb_batch import DEFAULT_WORKERS, make_process_pool
+
+    return make_process_pool(DEFAULT_WORKERS)
+
+
+# The one pool of worker processes, kept alive across reruns. Its size is server
+# configuration (TMB_WORKERS), not a per-session setting, so the number of processes is
+# bounded. A pool broken by a dead worker is replaced. None when only one worker is
+# configured, in which case the PDFs are parsed in the job threads.
+def get_process_pool():
+    from tmb_batch import DEFAULT_WORKERS, pool_is_broken
+
+    if DEFAULT_WORKERS <= 1:
+        return None
+    pool = _process_pool()
+    if pool_is_broken(pool):
+        _process_pool.clear()
+        pool.shutdown(wait=False, cancel_futures=True)
+        pool = _process_pool()
+    return pool
+
+
+# Queue of background ingest jobs
+@st.cache_resource
+def get_job_queue():
+    from ingest_jobs import JobQueue
+
+    return JobQueue(get_results_store(), get_pdf_cache())
+
+
+# Filter index of the rows of a finished ingest job, built once per job. Keyed by the job id,
+# not its key: a failed job is retried as a new job with the same key and other rows.
+@st.cache_resource(max_entries=8)
+def get_group_index(job_id, _df):
+    from result_explorer import GroupIndex
+
+    return GroupIndex(_df)
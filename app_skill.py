@@ -1,194 +1,43 @@
 import streamlit as st
-import pdfplumber
 import pandas as pd
-import re
-from io import BytesIO
-
-
-# Function to find the page with the "Skill-based Summary" header
-def find_skill_summary_page(pdf):
-    # st.write("Calling find_skill_summary_page")  # Debug statement
-    for i in range(4, 8):  # Page indices for pages 5 to 8
-        try:
-            page = pdf.pages[i]
-            text = page.extract_text()
-            if text and "Skill-based Summary" in text:
-                # st.write("Skill-based Summary found on page:", i + 1)  # Debug statement
-                return i
-        except IndexError:
-            break
-    st.write("Skill-based Summary not found")  # Debug statement
-    return None
-
-# Function to extract the year based on specific terms (e.g., "Summer 2023")
-def extract_year_from_pdf(pdf):
-    # Define the patterns to search for, including month-year patterns
-    patterns = [
-        r"Summer 2023", r"Winter 2023",
-        r"Summer 2024", r"Winter 2024",
-        r"Summer 2022", r"Winter 2022",
-
-        # Month-year combinations
-        r"January \d{4}", r"February \d{4}", r"March \d{4}", r"April \d{4}",
-        r"May \d{4}", r"June \d{4}", r"July \d{4}", r"August \d{4}",
-        r"September \d{4}", r"October \d{4}", r"November \d{4}", r"December \d{4}"
-    ]
-
-    page = pdf.pages[3]
-    text = page.extract_text()
-
-    if text:
-        # Search for the specific patterns
-        for pattern in patterns:
-            match = re.search(pattern, text)
-            if match:
-                # After finding the pattern, extract the year from the matched string
-                year_match = re.search(r"\d{4}", match.group(0))  # Extract the year from the match
-                if year_match:
-                    year = year_match.group(0)  # This will give the actual year (e.g., '2023')
-                    return year
-
-    return None
-
-
-# Function to extract school code, subject, class, and section from the footer
-def extract_info_from_footer(pdf):
-  
-        # st.write("Calling extract_info_from_footer")  # Debug statement
-        for page in pdf.pages:
-            # Get the height and width of the page to target the footer area
-            page_height = page.height
-            page_width = page.width
-            
-            # Define a box at the bottom of the page to extract footer text
-            footer_box = (0, page_height - 50, page_width, page_height)
-            footer_text = page.within_bbox(footer_box).extract_text()
-            
-            if footer_text :
-                #st.write("Footer text for info extraction:", footer_text)  # Debug statement
-                match = re.search(r"(\d+)/([A-Z]{1,2})(\d{1,2})([A-Z]{1,2})", footer_text.strip())
-                #st.write("Match text",match)
-                if match:
-                    school_code = match.group(1)
-                    subject_code = match.group(2)
-                    class_value = match.group(3)
-                    section = match.group(4)
-                    # st.write("Extracted info - School Code:", school_code, "Subject:", subject_code, "Class:", class_value, "Section:", section)  # Debug statement
-                    
-                    if subject_code == 'E':
-                        subject = 'English'
-                    elif subject_code == 'M':
-                        subject = 'Maths'
-                    elif subject_code == 'S':
-                        subject = 'Science'
-                    elif subject_code == 'C' or subject_code == 'CT':
-                        subject = 'Computational Thinking'
-                    elif subject_code == 'G':
-                        subject = 'Social Studies'
-                    elif subject_code == 'H':
-                        subject = 'Hindi'    
-                    else:
-                        subject = 'Unknown'
-                    
-                    return school_code, subject, class_value, section
-        st.write("No school code/subject/class/section found")  # Debug statement
-        return None, None, None, None
-def search_for_assetdynamic(pdf):
-    # Extract text from page 1 (index 0 since indexing starts at 0)
-    page = pdf.pages[0]
-    page_text = page.extract_text()
-
-    if page_text:
-        # Check if 'ASSET Dynamic' is in the extracted text
-        if 'ASSET Dynamic' in page_text:
-            return True
-        else:
-            return False
-    return False    
-# Function to extract data from a single PDF
-def extract_data_from_pdf(uploaded_file):
-    # st.write("Calling extract_data_from_pdf")  # Debug statement
-    with pdfplumber.open(BytesIO(uploaded_file.read())) as pdf:
-        # Extract the year from the PDF
-        year = extract_year_from_pdf(pdf)
-        if not year:
-            st.warning("Year not found in the PDF.")
-            return pd.DataFrame()
-        
-        # Extract school code, subject, class, and section from the footer
-        school_code, subject, class_value, section = extract_info_from_footer(pdf)
-        if not school_code or not subject or not class_value or not section:
-            st.warning("School code, subject, class, or section not found in the PDF footer.")
-            return pd.DataFrame()
-        
-        # Find the page containing "Skill-based Summary"
-        page_number = find_skill_summary_page(pdf)
-        if page_number is None:
-            st.warning("Skill-based Summary not found in the PDF.")
-            return pd.DataFrame()
-        
-        # Extract the table from the identified page
-        page = pdf.pages[page_number]
-        table = page.extract_table()
-    
-    # Extract relevant rows and columns
-    if table:
-        # st.write("Table found in the PDF")  # Debug statement
-        data = []
-        for row in table[2:]:
-            if row[0] is not None and search_for_assetdynamic(pdf) :
-                data.append([row[0], row[1], row[2], row[3], row[4]])
-            else:
-                data.append([row[0], row[1], row[3], row[4], row[5]])
-        
-        df = pd.DataFrame(data, columns=["S.no", "Skill", "Section Performance", "Class Performance", "National Performance"])
-        df['School Code'] = school_code
-        df['Subject'] = subject
-        df['Class'] = class_value
-        df['Section'] = section
-        df['Year'] = year  # Add the extracted year here
-        
-        return df
-    else:
-        st.warning("No table found in the PDF.")
-        return pd.DataFrame()
+from app_resources import get_group_index, get_results_store
+from excel_export import DOWNLOAD_FORMATS, download_file_name, download_options, table_download
+from instrumentation import activate, bind, profile_options, show_profile_panel, stage
+from ingest_jobs import ingest_uploads
+from result_explorer import show_explorer
+from skill_cube import SKILL_CUBE_CHANGES, SKILL_CUBE_MEASURES, school_comparison, year_comparison
 
 # Streamlit App
 st.title("Skill Based Summary")
 st.markdown("This facility is to be able to give you yearwise collection of skills by uploading the TMBs of a school for ASSET Pen and Paper/AD.")
 
 # Upload PDFs
-uploaded_files = st.file_uploader("Upload PDF files. Note that you can attach TMBs of as many academic years from 2022 to 2024.", type="pdf", accept_multiple_files=True)
+uploaded_files = st.file_uploader("Upload PDF files, or ZIP archives of them. TMBs of earlier academic years uploaded before are kept, so you only need to attach the new ones.", type=["pdf", "zip"], accept_multiple_files=True)
 
-if uploaded_files:
-    dfs = []
-    for uploaded_file in uploaded_files:
-        df = extract_data_from_pdf(uploaded_file)
-        if not df.empty:
-            dfs.append(df)
-    
-    if dfs:
-        final_df = pd.concat(dfs, ignore_index=True)
+download_format, single_workbook = download_options()
+include_stored_years = st.sidebar.checkbox("Include earlier uploads of these schools in the year-wise comparison", value=True)
+# Wall time (and allocations) of each stage of each file, shown below the results
+profile = profile_options("app_skill")
 
+if uploaded_files:
+    job, final_df, profile = ingest_uploads("skill", uploaded_files, profile)
+    if final_df is not None:
         st.write("Complete Skill list")
-        st.dataframe(final_df)
-        excel_file_path_complete="Complete Skill Summary.xlsx"
-        final_df.to_excel(excel_file_path_complete)
-
-        st.download_button(
-            label="Download complete data as Excel File",
-            data=open(excel_file_path_complete, "rb").read(),
-            file_name="Complete Skill Summary.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-
-        # Pivot the DataFrame to organize by School Code, Class, Subject, and Year
-        pivot_df = final_df.pivot_table(
-            index=["School Code", "Class", "Subject", "Skill"],
-            columns="Year",
-            values=["Class Performance", "National Performance"],
-            aggfunc="first"
-        ).reset_index()
+        show_explorer(final_df, get_group_index(job.id, final_df), key="skill")
+
+        # The year-wise comparison is looked up in the skill cube of the results store, which
+        # holds every year stored for the uploaded schools, not only this upload
+        store = get_results_store()
+        with activate(profile), stage("skill cube"):
+            cube_df = store.load_skill_cube({"School Code": final_df["School Code"].dropna().unique().tolist()})
+            if not include_stored_years:
+                # Only the classes, subjects and years of this upload
+                keys = ["School Code", "Class", "Subject", "Year"]
+                uploaded = pd.MultiIndex.from_frame(final_df[keys].astype(str))
+                cube_df = cube_df[pd.MultiIndex.from_frame(cube_df[keys].astype(str)).isin(uploaded)]
+
+            # One column per score and year, for every School Code, Class, Subject and Skill
+            pivot_df = year_comparison(cube_df)
 
         # Flatten the multi-level columns
         # pivot_df.columns = [' '.join(col).strip() if col[1] else col[0] for col in pivot_df.columns]
@@ -203,15 +52,58 @@ if uploaded_files:
         st.write("Skill comparison year wise")
         st.dataframe(pivot_df)
 
-
-        excel_file_path = "Skill Summary.xlsx"
-        pivot_df.to_excel(excel_file_path)
-
-        st.download_button(
-            label="Download Pivoted data as Excel File",
-            data=open(excel_file_path, "rb").read(),
-            file_name="Skill Summary.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        # Drill down to one class and subject of a school, with the change since the previous year
+        st.write("Skill drill-down")
+        drill_columns = st.columns(3)
+        school_code = drill_columns[0].selectbox("School Code", sorted(cube_df["School Code"].dropna().unique().tolist()))
+        school_df = cube_df[cube_df["School Code"] == school_code]
+        class_code = drill_columns[1].selectbox("Class", sorted(school_df["Class"].dropna().unique().tolist()))
+        school_df = school_df[school_df["Class"] == class_code]
+        subject = drill_columns[2].selectbox("Subject", sorted(school_df["Subject"].dropna().unique().tolist()))
+        drill_df = school_df[school_df["Subject"] == subject]
+        st.dataframe(
+            drill_df[["Skill", "Year", "Sections"] + SKILL_CUBE_MEASURES + SKILL_CUBE_CHANGES].reset_index(drop=True)
         )
+
+        # Compare the school with every school stored for the same class, subject and year
+        years = sorted(drill_df["Year"].dropna().unique().tolist())
+        if years:
+            year = st.selectbox("Compare with the other schools in", years, index=len(years) - 1)
+            with activate(profile), stage("skill cube"):
+                peers_df = store.load_skill_cube({"Class": [class_code], "Subject": [subject], "Year": [year]})
+            st.write(f"School {school_code} against {peers_df['School Code'].nunique()} schools, Class {class_code} {subject} {year}")
+            st.dataframe(school_comparison(peers_df, school_code))
+
+        # Downloads are built in memory only when they are requested. Workbooks keep the row
+        # numbers; the other formats hold the columns only
+        format_name = DOWNLOAD_FORMATS[download_format][0]
+        index = download_format == "xlsx"
+        if single_workbook:
+            sheets = {"Complete Skill Summary": final_df, "Skill Summary": pivot_df}
+            file_name, mime = download_file_name("Skill Summary", download_format, len(sheets))
+            st.download_button(
+                label=f"Download all data as one {'Excel workbook' if download_format == 'xlsx' else f'ZIP of {format_name} files'}",
+                data=bind(profile, table_download(sheets, download_format, index=index)),
+                file_name=file_name,
+                mime=mime
+            )
+        else:
+            file_name, mime = download_file_name("Complete Skill Summary", download_format)
+            st.download_button(
+                label=f"Download complete data as {format_name} File",
+                data=bind(profile, table_download({"Complete Skill Summary": final_df}, download_format, index=index, data_key=job.id)),
+                file_name=file_name,
+                mime=mime
+            )
+
+            file_name, mime = download_file_name("Skill Summary", download_format)
+            st.download_button(
+                label=f"Download Pivoted data as {format_name} File",
+                data=bind(profile, table_download({"Skill Summary": pivot_df}, download_format, index=index)),
+                file_name=file_name,
+                mime=mime
+            )
     else:
-        st.error("No valid tables found in the uploaded PDFs.")  
+        st.error("No valid tables found in the uploaded PDFs.")
+
+    show_profile_panel(profile)
@@ -0,0 +1,261 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+import pandas as pd
+
+from benchmarks.synthetic_tmb import generate_tmb_batch, generate_trail
+
+DEFAULT_SIZES = [10, 100, 1000]
+DEFAULT_TRAIL_SIZES = [1000, 10000, 50000]
+
+
+class StageTimer:
+    # Collects wall time per named stage, per call
+
+    def __init__(self):
+        self.samples = {}
+
+    def time(self, stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.samples.setdefault(stage, []).append(time.perf_counter() - start)
+        return result
+
+    # Add the stage records of an instrumentation.BatchProfile
+    def extend(self, records):
+        for record in records:
+            self.samples.setdefault(record["stage"], []).append(record["seconds"])
+
+    def summary(self):
+        stages = {}
+        for stage, samples in self.samples.items():
+            ordered = sorted(samples)
+            stages[stage] = {
+                "calls": len(samples),
+                "total_s": sum(samples),
+                "p50_ms": statistics.median(ordered) * 1000,
+                "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+            }
+        return stages
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return own, children
+
+
+# Benchmark of the app.py pipeline: page 3 extraction, DataFrames, concat, distribution cube, Excel
+def bench_percentile(paths, workers):
+    from excel_export import write_excel
+    from percentile_distribution import build_distribution_cube, distribution_view
+    from tmb_batch import extract_many, make_process_pool
+    from tmb_extraction import parse_percentile_pdf, percentile_frame
+    from tmb_schema import concat_frames
+
+    timer = StageTimer()
+    start = time.perf_counter()
+    items = [(path, timer.time("read", _read, path)) for path in paths]
+    if workers > 1:
+        with make_process_pool(workers) as pool:
+            results = timer.time("parse (pool)", extract_many, items, "percentile", pool=pool)
+    else:
+        results = [timer.time("parse", parse_percentile_pdf, pdf_bytes) for _, pdf_bytes in items]
+    frames = [timer.time("frame", percentile_frame, path, result)[0] for path, result in zip(paths, results)]
+    final_df = timer.time("concat", concat_frames, "percentile", [df for df in frames if df is not None])
+    final_df = final_df.dropna(subset=['Percentile'])
+    cube = timer.time("distribution", build_distribution_cube, final_df)
+    views = {"Class Subject": distribution_view(cube, ['Class', 'Subject']), "School": distribution_view(cube, ['Subject'])}
+    timer.time("excel", write_excel, dict(views, Students=final_df))
+    return time.perf_counter() - start, len(final_df), timer.summary()
+
+
+# Benchmark of the app_skill.py pipeline: page scan and summary table, DataFrames, concat,
+# store write (which keeps the skill cube up to date), year-wise comparison from the cube, Excel
+def bench_skill(paths, workers):
+    from excel_export import write_excel
+    from pdf_cache import content_hash
+    from results_store import ResultsStore
+    from skill_cube import year_comparison
+    from tmb_batch import extract_many, make_process_pool
+    from tmb_extraction import parse_skill_pdf, skill_frame
+    from tmb_schema import concat_frames
+
+    timer = StageTimer()
+    start = time.perf_counter()
+    items = [(path, timer.time("read", _read, path)) for path in paths]
+    if workers > 1:
+        with make_process_pool(workers) as pool:
+            results = timer.time("parse (pool)", extract_many, items, "skill", pool=pool)
+    else:
+        results = [timer.time("parse", parse_skill_pdf, pdf_bytes) for _, pdf_bytes in items]
+    frames = [timer.time("frame", skill_frame, path, result)[0] for path, result in zip(paths, results)]
+    final_df = timer.time("concat", concat_frames, "skill", [df for df in frames if df is not None])
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = ResultsStore(os.path.join(store_dir, "results.sqlite"))
+        for (path, pdf_bytes), df in zip(items, frames):
+            if df is not None:
+                timer.time("store write", store.add_file, "skill", content_hash(pdf_bytes), path, df)
+        schools = final_df["School Code"].dropna().unique().tolist()
+        cube_df = timer.time("cube query", store.load_skill_cube, {"School Code": schools})
+    pivot_df = timer.time("year pivot", year_comparison, cube_df)
+    timer.time("excel", write_excel, {"Complete": final_df, "Pivot": pivot_df}, index=True)
+    return time.perf_counter() - start, len(final_df), timer.summary()
+
+
+# Benchmark of the ingest job of the apps (results_store.iter_ingest): each TMB is parsed
+# once for every kind of rows (parse_tmb_pdf), turned into DataFrames (tmb_frames), written to
+# a results store and its rows read back. A second ingest of the same files only reads them
+# from the store. The stages inside the ingest are recorded with a stage profile.
+def bench_tmb(paths, workers):
+    from instrumentation import BatchProfile, activate
+    from results_store import ResultsStore, iter_ingest
+    from tmb_batch import make_process_pool
+    from tmb_uploads import iter_upload_pdfs
+
+    timer = StageTimer()
+    profile = BatchProfile("benchmark", log=False)
+    start = time.perf_counter()
+    uploads = [(path, timer.time("read", _read, path)) for path in paths]
+
+    def ingest(store, pool):
+        rows = iter_ingest(store, "percentile", iter_upload_pdfs(uploads), pool=pool)
+        return [df for _, _, df, _ in rows if df is not None]
+
+    with tempfile.TemporaryDirectory() as store_dir, make_process_pool(workers) if workers > 1 else nullcontext() as pool:
+        store = ResultsStore(os.path.join(store_dir, "results.sqlite"))
+        with activate(profile):
+            frames = timer.time("ingest", ingest, store, pool)
+            timer.time("ingest (stored)", ingest, store, pool)
+    seconds = time.perf_counter() - start
+    timer.extend(profile.records)
+    return seconds, sum(len(df) for df in frames), timer.summary()
+
+
+# Benchmark of the app_casestudy.py table and chart for one trail
+def bench_trail(questions):
+    from learning_trail import render_trail_chart_png, segment_trail
+
+    timer = StageTimer()
+    trail_df = generate_trail(questions)
+    levels = pd.DataFrame({'Concept': trail_df['Cluster'].unique()})
+    levels['Concept Level'] = range(len(levels))
+    start = time.perf_counter()
+    merged_df = timer.time("merge", pd.merge, trail_df, levels, left_on='Cluster', right_on='Concept', how='left')
+    merged_df = timer.time("sort", merged_df.sort_values, by='Question_Number')
+    table_df = timer.time("segment", segment_trail, merged_df)
+    timer.time("chart", render_trail_chart_png, merged_df['Question_Number'].values,
+               merged_df['Concept Level'].values, merged_df['Mode'].values, "Learning trail")
+    return time.perf_counter() - start, len(table_df), timer.summary()
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+CASES = {
+    "percentile": bench_percentile,
+    "skill": bench_skill,
+    "tmb": bench_tmb,
+    "trail": bench_trail,
+}
+
+
+# Runs in a fresh process so peak memory belongs to this case alone
+def run_case(name, size, paths, workers):
+    if name == "trail":
+        seconds, rows, stages = CASES[name](size)
+        unit = "questions"
+    else:
+        seconds, rows, stages = CASES[name](paths, workers)
+        unit = "files"
+    own_mb, children_mb = _peak_rss_mb()
+    return {
+        "case": name,
+        "size": size,
+        "unit": unit,
+        "workers": workers,
+        "seconds": seconds,
+        "throughput_per_s": size / seconds if seconds else None,
+        "rows": rows,
+        "peak_rss_mb": own_mb,
+        "peak_worker_rss_mb": children_mb,
+        "stages": stages,
+    }
+
+
+def run_in_fresh_process(*args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(run_case, *args).result()
+
+
+def print_report(results):
+    for r in results:
+        print(f"{r['case']:<11} {r['size']:>6} {r['unit']:<9} workers={r['workers']:<3} "
+              f"{r['seconds']:8.2f}s {r['throughput_per_s']:9.1f} {r['unit']}/s "
+              f"peak {r['peak_rss_mb']:7.1f} MB (workers {r['peak_worker_rss_mb']:.1f} MB)")
+        for stage, s in r["stages"].items():
+            print(f"    {stage:<14} {s['total_s']:8.3f}s  p50 {s['p50_ms']:8.2f} ms  p95 {s['p95_ms']:8.2f} ms  x{s['calls']}")
+
+
+# Function to list the cases that got slower than the baseline by more than the tolerance
+def find_regressions(results, baseline, tolerance):
+    previous = {(r["case"], r["size"], r["workers"]): r for r in baseline}
+    regressions = []
+    for r in results:
+        old = previous.get((r["case"], r["size"], r["workers"]))
+        if old and r["seconds"] > old["seconds"] * (1 + tolerance):
+            regressions.append(f"{r['case']} x{r['size']} (workers={r['workers']}): "
+                               f"{old['seconds']:.2f}s -> {r['seconds']:.2f}s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark TMB extraction and the learning trail table and chart.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="numbers of TMB files")
+    parser.add_argument("--trail-sizes", type=int, nargs="+", default=DEFAULT_TRAIL_SIZES, help="learning trail lengths")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=sorted(CASES))
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for the extraction (1 also records per-file stage times)")
+    parser.add_argument("--fixtures", default=os.path.join(tempfile.gettempdir(), "tmb_benchmark_fixtures"),
+                        help="directory of generated TMBs, reused between runs (default %(default)s)")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline (default 0.2)")
+    args = parser.parse_args(argv)
+
+    results = []
+    if any(case != "trail" for case in args.cases):
+        all_paths = generate_tmb_batch(args.fixtures, max(args.sizes))
+    for case in args.cases:
+        sizes = args.trail_sizes if case == "trail" else args.sizes
+        for size in sizes:
+            paths = None if case == "trail" else all_paths[:size]
+            results.append(run_in_fresh_process(case, size, paths, args.workers))
+            print_report(results[-1:])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Slower than the baseline:", *regressions, sep="\n  ", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+import argparse
+import os
+import random
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# Page size of the generated reports (A4, in PDF points)
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+
+SUBJECT_CODES = ['E', 'M', 'S']
+SEASONS = ['Summer', 'Winter']
+MODES = ['Learn', 'Remediation', 'Challenge']
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+# Function to build the content stream of one page.
+# texts are (x, y from top, text, font size); tables are (x, y from top, column widths, row height, rows)
+def _page_content(texts, tables):
+    ops = []
+    for x, y, text, size in texts:
+        ops.append(f"BT /F1 {size} Tf {x} {PAGE_HEIGHT - y} Td ({_escape(text)}) Tj ET")
+
+    for x0, y0, column_widths, row_height, rows in tables:
+        xs = [x0]
+        for width in column_widths:
+            xs.append(xs[-1] + width)
+        ys = [y0 + i * row_height for i in range(len(rows) + 1)]
+
+        # Ruled grid, which is what pdfplumber's table finder looks for
+        ops.append("0.5 w")
+        for y in ys:
+            ops.append(f"{xs[0]} {PAGE_HEIGHT - y} m {xs[-1]} {PAGE_HEIGHT - y} l S")
+        for x in xs:
+            ops.append(f"{x} {PAGE_HEIGHT - ys[0]} m {x} {PAGE_HEIGHT - ys[-1]} l S")
+
+        for r, row in enumerate(rows):
+            for c, value in enumerate(row):
+                if value:
+                    ops.append(f"BT /F1 8 Tf {xs[c] + 2} {PAGE_HEIGHT - ys[r] - row_height + 4} Td ({_escape(str(value))}) Tj ET")
+    return "\n".join(ops).encode("latin-1")
+
+
+# Function to write a minimal PDF with one Helvetica font and the given pages
+def build_pdf(pages):
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for texts, tables in pages:
+        data = zlib.compress(_page_content(texts, tables))
+        objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(data) + data + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}]"
+            f" /Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>".encode("latin-1")
+        )
+        kids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>".encode("latin-1")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode("latin-1") + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return bytes(out)
+
+
+# Function to generate one TMB-like report: the student percentile table on page 3,
+# the season and year on page 4, the Skill-based Summary table on one of pages 5-8 and
+# a footer code such as 1234/M8A on every page.
+def generate_tmb(school_code="1234", subject_code="M", class_value=8, section="A", year=2023,
+                 asset_dynamic=False, students=30, skills=10, summary_page=5, seed=0):
+    rng = random.Random(seed)
+    footer = [(40, PAGE_HEIGHT - 20, f"{school_code}/{subject_code}{class_value}{section}", 8)]
+
+    title = "ASSET Dynamic Teacher Report" if asset_dynamic else "ASSET Teacher Manual Booklet"
+    pages = [
+        ([(40, 80, title, 16)] + footer, []),
+        ([(40, 80, "Overview", 12)] + footer, []),
+    ]
+
+    # Page 3: header row and a blank second row, which the extraction drops
+    student_rows = [["S.No", "Student Name", "Score", "Percentile", "Grade"], ["", "", "", "", ""]]
+    for i in range(students):
+        student_rows.append([str(i + 1), f"Student {i + 1}", str(rng.randint(5, 40)), str(rng.randint(1, 100)), "A"])
+    pages.append(([(40, 60, "Student Performance", 12)] + footer, [(40, 80, [40, 200, 60, 70, 50], 14, student_rows)]))
+
+    pages.append(([(40, 60, f"Report for {rng.choice(SEASONS)} {year}", 12)] + footer, []))
+
+    for page_number in range(5, 9):
+        if page_number != summary_page:
+            pages.append(([(40, 60, f"Page {page_number}", 12)] + footer, []))
+            continue
+        if asset_dynamic:
+            widths = [40, 220, 80, 80, 80]
+            header = [["S.no", "Skill", "Section", "Class", "National"], ["", "", "Perf", "Perf", "Perf"]]
+        else:
+            widths = [40, 200, 50, 80, 80, 80]
+            header = [["S.no", "Skill", "Qs", "Section", "Class", "National"], ["", "", "", "Perf", "Perf", "Perf"]]
+        body = []
+        for k in range(skills):
+            scores = [f"{rng.randint(20, 95)}%" for _ in range(3)]
+            extra = [] if asset_dynamic else [str(rng.randint(1, 5))]
+            body.append([str(k + 1), f"Skill {k + 1}"] + extra + scores)
+        pages.append(([(40, 60, "Skill-based Summary", 12)] + footer, [(40, 80, widths, 16, header + body)]))
+
+    return build_pdf(pages)
+
+
+# Function to write a batch of TMBs into a directory, named like 1234_M8A_2023.pdf.
+# Alternates pen-and-paper and ASSET Dynamic reports. Returns the file paths.
+def generate_tmb_batch(directory, count, students=30, skills=10, seed=0):
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        school_code = str(1000 + i // 30)
+        subject_code = SUBJECT_CODES[i % len(SUBJECT_CODES)]
+        class_value = 3 + (i // len(SUBJECT_CODES)) % 7
+        section = "ABCD"[(i // 21) % 4]
+        year = 2022 + i % 3
+        path = os.path.join(directory, f"{school_code}_{subject_code}{class_value}{section}_{year}_{i}.pdf")
+        if not os.path.exists(path):
+            data = generate_tmb(school_code, subject_code, class_value, section, year,
+                                asset_dynamic=i % 2 == 1, students=students, skills=skills,
+                                summary_page=rng.randint(5, 8), seed=seed + i)
+            with open(path, "wb") as f:
+                f.write(data)
+        paths.append(path)
+    return paths
+
+
+# Function to generate a learning trail in the layout app_casestudy.py reads
+def generate_trail(questions, clusters=30, topic="Fractions", seed=0):
+    rng = np.random.default_rng(seed)
+    mode_changes = rng.random(questions) < 0.08
+    cluster_changes = rng.random(questions) < 0.05
+    # Each question keeps the mode drawn at the most recent change point
+    last_change = np.maximum.accumulate(np.where(mode_changes, np.arange(questions), 0))
+    modes = np.array(MODES)[rng.integers(0, len(MODES), questions)[last_change]]
+    cluster_ids = np.cumsum(cluster_changes) % clusters
+    return pd.DataFrame({
+        'Topic': topic,
+        'Question_Number': np.arange(1, questions + 1),
+        'Cluster': [f"Concept {c}" for c in cluster_ids],
+        'Mode': modes,
+        'Correctness': rng.integers(0, 2, questions),
+    })
+
+
+# Function to write a learning trail workbook, one sheet per student
+def write_trail_workbook(path, questions, students=1, seed=0):
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        for s in range(students):
+            generate_trail(questions, seed=seed + s).to_excel(writer, index=False, sheet_name=f"Student {s + 1}")
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic TMB PDFs and learning trail workbooks.")
+    parser.add_argument("output_dir")
+    parser.add_argument("--tmbs", type=int, default=10, help="number of TMB PDFs")
+    parser.add_argument("--trails", type=int, default=1, help="number of learning trail workbooks")
+    parser.add_argument("--questions", type=int, default=500, help="questions per learning trail")
+    parser.add_argument("--students", type=int, default=1, help="student sheets per learning trail workbook")
+    args = parser.parse_args(argv)
+
+    generate_tmb_batch(os.path.join(args.output_dir, "tmbs"), args.tmbs)
+    for t in range(args.trails):
+        write_trail_workbook(os.path.join(args.output_dir, f"trail_{t + 1}.xlsx"), args.questions, args.students, seed=t)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import hashlib
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from io import BytesIO
+
+import pandas as pd
+
+from instrumentation import stage
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+ZIP_MIME = "application/zip"
+
+# Download formats: name shown in the apps, file extension and MIME type
+DOWNLOAD_FORMATS = {
+    "xlsx": ("Excel", ".xlsx", XLSX_MIME),
+    "csv": ("CSV", ".csv", "text/csv"),
+    "parquet": ("Parquet", ".parquet", "application/vnd.apache.parquet"),
+    "arrow": ("Arrow IPC", ".arrow", "application/vnd.apache.arrow.file"),
+}
+
+# Rows converted and written at a time by the streaming workbook writer
+XLSX_CHUNK_ROWS = 5000
+
+# Number of generated downloads kept in memory, shared by all sessions
+MAX_CACHED_DOWNLOADS = 16
+
+_downloads = OrderedDict()  # (format, sheet names, data key, index) -> file bytes
+_downloads_lock = threading.Lock()
+
+
+# Function to show the download options in the sidebar of an app. Returns the download
+# format and, for apps with several tables, whether to download them all as one file.
+def download_options(label="Download format", several_tables=True):
+    import streamlit as st
+
+    file_format = st.sidebar.selectbox(label, list(DOWNLOAD_FORMATS), format_func=lambda file_format: DOWNLOAD_FORMATS[file_format][0])
+    one_file = several_tables and st.sidebar.checkbox("Download all tables as one file (a ZIP of one file per table except for Excel)")
+    return file_format, one_file
+
+
+# Function to hash the contents of a DataFrame, including its columns and index
+def dataframe_hash(df):
+    h = hashlib.sha256()
+    h.update(repr(list(df.columns)).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+# Function to write one sheet with openpyxl's write-only worksheet, converting and
+# appending XLSX_CHUNK_ROWS rows at a time, with the cells DataFrame.to_excel would write.
+# A sheet always has one header row: multi-level columns are joined into one name each
+# (see _flat_columns), and the levels of a multi-level index become columns.
+def _write_sheet_streaming(workbook, sheet_name, df, index):
+    if isinstance(df.index, pd.MultiIndex):
+        df = df.reset_index() if index else df.reset_index(drop=True)
+        index = False
+    if isinstance(df.columns, pd.MultiIndex):
+        df = _flat_columns(df)
+    worksheet = workbook.create_sheet(sheet_name)
+    header = [str(column) for column in df.columns]
+    if index:
+        header.insert(0, df.index.name)
+    worksheet.append(header)
+
+    for start in range(0, len(df), XLSX_CHUNK_ROWS):
+        chunk = df.iloc[start:start + XLSX_CHUNK_ROWS]
+        if index:
+            chunk = chunk.reset_index(names="__index__")
+        values = chunk.astype(object).where(chunk.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            worksheet.append(row)
+
+
+# Function to write DataFrames into an in-memory workbook, one sheet per {sheet name: DataFrame} entry.
+# Every sheet is streamed through a write-only workbook, which keeps memory flat however
+# many rows there are.
+def write_excel(sheets, index=False):
+    from openpyxl import Workbook
+
+    buf = BytesIO()
+    with stage("to_excel"):
+        workbook = Workbook(write_only=True)
+        for sheet_name, df in sheets.items():
+            _write_sheet_streaming(workbook, sheet_name, df, index)
+        workbook.save(buf)
+    return buf.getvalue()
+
+
+# Function to give a DataFrame string column names, joining the levels of multi-level
+# columns (e.g. ("Class Performance", "2023") becomes "Class Performance 2023"), as
+# Parquet and Arrow need them and CSV and workbook sheets have one header row
+def _flat_columns(df):
+    if isinstance(df.columns, pd.MultiIndex):
+        columns = [" ".join(str(level) for level in column if str(level) != "").strip() for column in df.columns]
+    else:
+        columns = [str(column) for column in df.columns]
+    return df.set_axis(columns, axis=1)
+
+
+# Function to write one DataFrame as CSV, Parquet or Arrow IPC file bytes
+def write_table(df, file_format, index=False):
+    if file_format == "csv":
+        with stage("to_csv"):
+            return _flat_columns(df).to_csv(index=index).encode("utf-8")
+
+    import pyarrow as pa
+
+    with stage(f"to_{file_format}"):
+        table = pa.Table.from_pandas(_flat_columns(df), preserve_index=index)
+        if file_format == "parquet":
+            import pyarrow.parquet as pq
+
+            sink = pa.BufferOutputStream()
+            pq.write_table(table, sink)
+        elif file_format == "arrow":
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        else:
+            raise ValueError(f"Unknown download format {file_format!r}")
+        return sink.getvalue().to_pybytes()
+
+
+# Function to write the given sheets in a download format. A workbook holds every sheet;
+# the other formats hold one table, so several sheets are put in a ZIP of one file each.
+def write_download(sheets, file_format="xlsx", index=False):
+    if file_format == "xlsx":
+        return write_excel(sheets, index=index)
+    if len(sheets) == 1:
+        return write_table(next(iter(sheets.values())), file_format, index=index)
+
+    _, extension, _ = DOWNLOAD_FORMATS[file_format]
+    buf = BytesIO()
+    # Parquet and Arrow files are compressed or binary already, so only CSV is deflated
+    compression = zipfile.ZIP_DEFLATED if file_format == "csv" else zipfile.ZIP_STORED
+    with zipfile.ZipFile(buf, "w", compression=compression) as archive:
+        for sheet_name, df in sheets.items():
+            file_name = re.sub(r'[\\/:*?"<>|]+', "_", sheet_name)
+            archive.writestr(f"{file_name}{extension}", write_table(df, file_format, index=index))
+    return buf.getvalue()
+
+
+# Function to get the file name and MIME type of a download of the given number of sheets
+def download_file_name(stem, file_format, sheet_count=1):
+    _, extension, mime = DOWNLOAD_FORMATS[file_format]
+    if file_format != "xlsx" and sheet_count > 1:
+        return f"{stem}.zip", ZIP_MIME
+    return f"{stem}{extension}", mime
+
+
+# Function to get a download callback for the given sheets in a download format.
+# The file is only built when the callback runs (when the user clicks the download
+# button) and is cached by data_key, so identical datasets are built once. data_key
+# identifies the data of the sheets, e.g. the id of the ingest job they come from; without
+# one the data is hashed when the callback runs, so reruns that are not downloads never
+# hash it.
+def table_download(sheets, file_format="xlsx", index=False, data_key=None):
+    def build():
+        if data_key is None:
+            sheet_keys = tuple((sheet_name, dataframe_hash(df)) for sheet_name, df in sheets.items())
+        else:
+            sheet_keys = (tuple(sheets), data_key)
+        key = (file_format, sheet_keys, index)
+        with _downloads_lock:
+            if key in _downloads:
+                _downloads.move_to_end(key)
+                return _downloads[key]
+
+        data = write_download(sheets, file_format, index=index)
+
+        with _downloads_lock:
+            _downloads[key] = data
+            while len(_downloads) > MAX_CACHED_DOWNLOADS:
+                _downloads.popitem(last=False)
+        return data
+
+    return build
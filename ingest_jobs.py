@@ -0,0 +1,292 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import activate, stage
+from pdf_cache import content_hash
+from results_store import iter_ingest
+from tmb_batch import DEFAULT_MEMORY_LIMIT_MB, DEFAULT_WORKERS, FairShare, MemoryBudget
+from tmb_schema import concat_frames
+from tmb_uploads import count_upload_pdfs, is_zip_upload, iter_upload_pdfs
+
+# Number of ingest jobs run at the same time; later jobs wait in the queue
+DEFAULT_JOB_THREADS = int(os.environ.get("TMB_JOB_THREADS", 4))
+
+# Finished jobs are kept this long (in seconds), and at most this many, for reattaching
+FINISHED_JOB_TTL = 3600
+MAX_FINISHED_JOBS = 32
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+# Function to build the key of an ingest: the kind of rows and the content hashes of the
+# uploaded files (PDFs or ZIP archives as they were uploaded, not unpacked), in upload order.
+# The same upload gives the same key in any session.
+def job_key(kind, upload_hashes):
+    h = hashlib.sha256(kind.encode("utf-8"))
+    for upload_hash in upload_hashes:
+        h.update(upload_hash.encode("ascii"))
+    return h.hexdigest()
+
+
+# Columns of the first row shown for each ingested file in the running summary table, and
+# the name of its count of rows, by kind of rows
+SUMMARY_COLUMNS = {
+    "percentile": (["School Code"], "Students"),
+    "skill": (["School Code", "Subject", "Class", "Year"], "Skills"),
+}
+
+
+# Function to summarise one ingested file for the running summary table
+def summarize_file(kind, name, df, warning):
+    columns, rows = SUMMARY_COLUMNS.get(kind, ([], "Rows"))
+    first = df.iloc[0] if df is not None and not df.empty else None
+    summary = {"File": name}
+    summary.update({column: None if first is None else first[column] for column in columns})
+    summary[rows] = 0 if df is None else len(df)
+    summary["Status"] = "ok" if df is not None else "skipped"
+    return summary
+
+
+class IngestJob:
+    # One background ingest of a set of uploaded files. It runs outside the Streamlit script
+    # run, which only reads its state, so a rerun or a reconnected browser reattaches to it.
+    # total is the number of PDFs uploaded, counting those inside ZIP archives.
+
+    def __init__(self, key, kind, owner, total, profile=None):
+        self.id = uuid.uuid4().hex[:8]
+        self.key = key
+        self.kind = kind
+        self.owner = owner
+        self.total = total
+        self.profile = profile
+        self.status = QUEUED
+        self.error = None
+        self.finished_at = None
+        self._files = []  # one summary row per ingested file
+        self._frames = {}  # upload index -> rows
+        self._final = None  # (rows,) once put together after the job finished
+        self._warnings = []
+        self._skipped = []  # "name: reason" of every upload skipped
+        self._skipped_pdfs = 0  # PDFs among them (duplicates), counted as done
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    def _add(self, index, name, df, warning):
+        summary = summarize_file(self.kind, name, df, warning)
+        with self._lock:
+            if warning:
+                self._warnings.append(warning)
+            if df is not None:
+                self._frames[index] = df
+            self._files.append(summary)
+
+    def _skip(self, name, reason):
+        with self._lock:
+            self._skipped.append(f"{name}: {reason}")
+            if not is_zip_upload(name):
+                self._skipped_pdfs += 1
+
+    def _finish(self, status, error=None):
+        with self._lock:
+            self.status = status
+            self.error = error
+            self.finished_at = time.time()
+
+    # Consistent copy of the progress: status, files done, summary rows, warnings, skipped
+    # uploads and error
+    def snapshot(self):
+        with self._lock:
+            return {
+                "status": self.status,
+                "done": len(self._files) + self._skipped_pdfs,
+                "total": self.total,
+                "files": list(self._files),
+                "warnings": list(self._warnings),
+                "skipped": list(self._skipped),
+                "error": self.error,
+            }
+
+    # Rows of every file ingested so far, in upload order with a "File Hash" column, or None.
+    # Once the job has finished they are put together only once, for every rerun that reattaches.
+    def result(self):
+        with self._lock:
+            if self._final is not None:
+                return self._final[0]
+            finished = self.finished
+            frames = [self._frames[index] for index in sorted(self._frames) if not self._frames[index].empty]
+        rows = None
+        if frames:
+            with stage("concat"):
+                rows = concat_frames(self.kind, frames)
+        if finished:
+            with self._lock:
+                self._final = (rows,)
+                self._frames = {}
+        return rows
+
+
+class JobQueue:
+    # Runs ingest jobs on a few background threads. Their PDFs are parsed on the process pool
+    # of the given number of workers, whose slots are shared fairly between the owners that
+    # have jobs running. The pool itself may be replaced (e.g. after a worker died); the
+    # share of its slots carries over. memory_limit_mb bounds the estimated memory of the PDFs
+    # parsed at once by all the running jobs together, in the workers or in the job threads.
+
+    def __init__(self, store, cache=None, threads=DEFAULT_JOB_THREADS, workers=DEFAULT_WORKERS,
+                 memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB):
+        self.store = store
+        self.cache = cache
+        self._memory_budget = MemoryBudget(memory_limit_mb)
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="ingest-job")
+        self._jobs = {}  # job id -> job
+        self._by_key = {}  # job key -> latest job
+        self._fair_share = FairShare(2 * workers)
+        self._lock = threading.Lock()
+
+    # Submit an ingest of uploaded (name, buffer) files, PDFs or ZIP archives of PDFs, or
+    # return the job already running (or done) for the same uploads, so reruns neither unpack
+    # nor parse them again. A failed job is retried. The ZIP members are read by the job, one
+    # at a time as they are parsed. upload_hashes are the content hashes of the uploads,
+    # when the caller has them already; an uploaded PDF is not hashed again by the job.
+    def submit(self, kind, uploads, owner, pool=None, profile=None, upload_hashes=None):
+        if upload_hashes is None:
+            upload_hashes = [content_hash(buffer) for _, buffer in uploads]
+        key = job_key(kind, upload_hashes)
+        with self._lock:
+            self._forget_finished()
+            job = self._by_key.get(key)
+            if job is not None and job.status != FAILED:
+                return job
+            job = IngestJob(key, kind, owner, count_upload_pdfs(uploads), profile=profile)
+            self._jobs[job.id] = job
+            self._by_key[key] = job
+        fair_share = self._fair_share if pool is not None else None
+        self._executor.submit(self._run, job, uploads, upload_hashes, pool, fair_share)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _forget_finished(self):
+        now = time.time()
+        finished = sorted((job for job in self._jobs.values() if job.finished), key=lambda job: job.finished_at)
+        for i, job in enumerate(finished):
+            if now - job.finished_at > FINISHED_JOB_TTL or i < len(finished) - MAX_FINISHED_JOBS:
+                del self._jobs[job.id]
+                if self._by_key.get(job.key) is job:
+                    del self._by_key[job.key]
+
+    def _run(self, job, uploads, upload_hashes, pool, fair_share):
+        with job._lock:
+            job.status = RUNNING
+        if fair_share is not None:
+            fair_share.join(job.owner)
+        try:
+            with activate(job.profile):
+                items = iter_upload_pdfs(uploads, skipped=job._skip, upload_hashes=upload_hashes)
+                rows = iter_ingest(
+                    self.store, job.kind, items, cache=self.cache, pool=pool, memory_budget=self._memory_budget,
+                    fair_share=fair_share, owner=job.owner,
+                )
+                for index, name, df, warning in rows:
+                    job._add(index, name, df, warning)
+        except Exception as e:
+            # The files ingested so far stay in the job (and in the results store)
+            job._finish(FAILED, f"{type(e).__name__}: {e}")
+        else:
+            job._finish(DONE)
+        finally:
+            if fair_share is not None:
+                fair_share.leave(job.owner)
+
+
+# Function to get an id for the Streamlit session of the current script run, used to share
+# the workers fairly between sessions
+def session_owner():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else "local"
+
+
+# Function to show the progress of a job until it finishes: a progress bar, the running
+# summary table and the warnings. Touching a widget stops this script run, not the job;
+# the next run reattaches to it.
+def follow_job(job, poll_seconds=0.5):
+    import pandas as pd
+    import streamlit as st
+
+    st.caption(f"Ingest job {job.id}")
+    progress = st.progress(0.0, text=f"Waiting to process {job.total} PDFs...")
+    summary = st.empty()
+    warnings = st.container()
+    shown_warnings = 0
+    while True:
+        finished = job.finished
+        state = job.snapshot()
+        for warning in state["warnings"][shown_warnings:]:
+            warnings.warning(warning)
+        shown_warnings = len(state["warnings"])
+        if state["files"]:
+            summary.dataframe(pd.DataFrame(state["files"]))
+        if finished:
+            break
+        progress.progress(min(state["done"] / max(job.total, 1), 1.0), text=f"Processed {state['done']} of {job.total} PDFs")
+        time.sleep(poll_seconds)
+
+    progress.progress(1.0, text=f"Processed {state['done']} PDFs")
+    if state["skipped"]:
+        with st.expander(f"{len(state['skipped'])} uploaded files skipped"):
+            st.write("\n".join(f"- {line}" for line in state["skipped"]))
+    if state["status"] == FAILED:
+        st.error(f"Processing stopped after {state['done']} PDFs ({state['error']}). Showing the results of the PDFs processed so far.")
+
+
+# Function to ingest the uploaded files of a page (PDFs, or ZIP archives of PDFs) and show
+# the progress. The PDFs are ingested by a background job, which parses only the PDFs
+# missing from the results store, in parallel worker processes when more than one worker
+# is configured. A rerun with the same uploads reattaches to the job instead of parsing them
+# again, and the files done so far are kept if a later one fails. The uploads, and the PDFs
+# inside uploaded ZIPs, are read through memoryviews without copying them where possible;
+# the job unpacks the ZIPs as it goes, and a PDF uploaded twice is only ingested once.
+# Returns the job, its rows without the "File Hash" column (or None) and the profile to
+# show, which is the job's when a rerun reattached to a job that records timings.
+def ingest_uploads(kind, uploaded_files, profile=None):
+    import streamlit as st
+    from app_resources import get_job_queue, get_pdf_cache, get_process_pool
+
+    uploads = [(uploaded_file.name, uploaded_file.getbuffer()) for uploaded_file in uploaded_files]
+    # The content hash of each upload is kept in the session by its file id, so a rerun finds
+    # its job without hashing the uploads again
+    known_hashes = st.session_state.get("upload_hashes", {})
+    upload_hashes = [
+        known_hashes.get(uploaded_file.file_id) or content_hash(buffer)
+        for uploaded_file, (_, buffer) in zip(uploaded_files, uploads)
+    ]
+    st.session_state["upload_hashes"] = {
+        uploaded_file.file_id: upload_hash for uploaded_file, upload_hash in zip(uploaded_files, upload_hashes)
+    }
+    job = get_job_queue().submit(
+        kind, uploads, session_owner(), pool=get_process_pool(), profile=profile, upload_hashes=upload_hashes,
+    )
+    follow_job(job)
+    if profile is not None and job.profile is not None:
+        profile = job.profile
+    cache_stats = get_pdf_cache().stats()
+    st.caption(f"PDF cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+
+    # The rows of the files are put together in the job's "concat" stage
+    with activate(job.profile):
+        final_df = job.result()
+    return job, None if final_df is None else final_df.drop(columns="File Hash"), profile
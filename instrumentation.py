@@ -0,0 +1,204 @@
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+# Record stage timings by default when this is set, e.g. TMB_PROFILE=1
+PROFILE_BY_DEFAULT = os.environ.get("TMB_PROFILE", "") not in ("", "0")
+
+# Stage records are written to this logger as one JSON object per line
+logger = logging.getLogger("tmb.timing")
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+BATCH = "(batch)"  # File name of the stages that belong to the whole batch
+
+_active_profile = contextvars.ContextVar("tmb_active_profile", default=None)
+_current_file = contextvars.ContextVar("tmb_current_file", default=BATCH)
+
+
+class BatchProfile:
+    # Wall time (and optionally allocated bytes) of each stage of each file of one batch
+
+    def __init__(self, app, track_allocations=False, log=True):
+        self.app = app
+        self.track_allocations = track_allocations
+        self.log = log
+        self.records = []  # dicts with file, stage, seconds, alloc_bytes
+
+    def add(self, file, stage, seconds, alloc_bytes=None):
+        record = {"file": file, "stage": stage, "seconds": seconds, "alloc_bytes": alloc_bytes}
+        self.records.append(record)
+        if self.log:
+            logger.info(json.dumps({"event": "stage", "app": self.app, **record}))
+
+    def extend(self, file, records):
+        for record in records:
+            self.add(file, record["stage"], record["seconds"], record["alloc_bytes"])
+
+    # Wrap a zero-argument callable (such as a download callback that runs on another
+    # thread) so the stages it runs are recorded into this profile
+    def bind(self, func, file=BATCH):
+        def wrapper():
+            with activate(self), for_file(file):
+                return func()
+        return wrapper
+
+    def frame(self):
+        return pd.DataFrame(self.records, columns=["file", "stage", "seconds", "alloc_bytes"])
+
+    # Leave out the allocations column when they were not tracked
+    def _allocations(self, df):
+        return df if self.track_allocations else df.drop(columns="alloc_bytes")
+
+    # Total time and allocations of the n slowest files
+    def slowest_files(self, n=10):
+        df = self.frame()
+        df = df[df["file"] != BATCH]
+        totals = df.groupby("file").agg(seconds=("seconds", "sum"), alloc_bytes=("alloc_bytes", "sum"), stages=("stage", "nunique"))
+        return self._allocations(totals.sort_values("seconds", ascending=False).head(n).reset_index())
+
+    # Total, mean and worst time of every stage across the batch, slowest first
+    def stage_totals(self):
+        df = self.frame()
+        totals = df.groupby("stage").agg(
+            seconds=("seconds", "sum"),
+            calls=("seconds", "size"),
+            mean_ms=("seconds", "mean"),
+            max_ms=("seconds", "max"),
+            alloc_bytes=("alloc_bytes", "sum"),
+        )
+        totals["mean_ms"] *= 1000
+        totals["max_ms"] *= 1000
+        return self._allocations(totals.sort_values("seconds", ascending=False).reset_index())
+
+
+# The profile stages are currently recorded into, or None
+def current_profile():
+    return _active_profile.get()
+
+
+# Function to bind func to the profile, or return it unchanged when there is no profile
+def bind(profile, func, file=BATCH):
+    return func if profile is None else profile.bind(func, file)
+
+
+# Make the profile the one stages are recorded into, in this thread or process. Tracing of
+# allocations is process-wide and slows every thread down, so it runs only while at least
+# one profile that tracks allocations is active: the first one starts it and the last one
+# to finish stops it, without breaking the numbers of the others still running.
+@contextmanager
+def activate(profile):
+    tracking = profile is not None and profile.track_allocations
+    if tracking:
+        _start_tracing()
+    token = _active_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _active_profile.reset(token)
+        if tracking:
+            _stop_tracing()
+
+
+_tracing_lock = threading.Lock()
+_tracing_users = 0  # active profiles that track allocations
+_started_tracing = False  # whether tracing was started here, not by the interpreter (-X tracemalloc)
+
+
+def _start_tracing():
+    global _tracing_users, _started_tracing
+    with _tracing_lock:
+        _tracing_users += 1
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+
+
+def _stop_tracing():
+    global _tracing_users, _started_tracing
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+
+# Attribute the stages run inside this block to the given file
+@contextmanager
+def for_file(file):
+    token = _current_file.set(file)
+    try:
+        yield
+    finally:
+        _current_file.reset(token)
+
+
+# Time a stage. Does nothing unless a profile is active, so the extraction code can
+# always be wrapped in stages. Allocations are the growth of the traced memory over the
+# stage, i.e. what it allocated and kept. The peak is not used as it is shared by every
+# thread, and resetting it would reset it for the stages running on other threads.
+@contextmanager
+def stage(name):
+    profile = _active_profile.get()
+    if profile is None:
+        yield
+        return
+
+    tracing = profile.track_allocations and tracemalloc.is_tracing()
+    if tracing:
+        start_memory = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        alloc_bytes = max(tracemalloc.get_traced_memory()[0] - start_memory, 0) if tracing else None
+        profile.add(_current_file.get(), name, seconds, alloc_bytes)
+
+
+# Function to run func and return its result with the stage records it produced, plus
+# a "parse (other)" record for the time not covered by any stage. Used in worker processes.
+def run_profiled(func, *args, track_allocations=False):
+    # Worker records are logged by the parent process once it attributes them to a file
+    profile = BatchProfile(app="worker", track_allocations=track_allocations, log=False)
+    start = time.perf_counter()
+    with activate(profile):
+        result = func(*args)
+    other = time.perf_counter() - start - sum(record["seconds"] for record in profile.records)
+    profile.add(BATCH, "parse (other)", max(other, 0.0))
+    return result, profile.records
+
+
+# Function to show the profiling options in the sidebar of an app. Returns a new profile
+# for a run of the app when stage timings are recorded, else None.
+def profile_options(app):
+    import streamlit as st
+
+    record_timings = st.sidebar.checkbox("Record stage timings", value=PROFILE_BY_DEFAULT)
+    track_allocations = record_timings and st.sidebar.checkbox("Also track memory allocations (slower)")
+    return BatchProfile(app, track_allocations) if record_timings else None
+
+
+# Function to show the slowest files and stages of a profile in a collapsible panel
+def show_profile_panel(profile, n=10):
+    import streamlit as st
+
+    if profile is None or not profile.records:
+        return
+    with st.expander("Stage timings"):
+        st.write(f"Slowest {n} files")
+        st.dataframe(profile.slowest_files(n))
+        st.write("Time per stage")
+        st.dataframe(profile.stage_totals())
@@ -0,0 +1,114 @@
+import threading
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+from matplotlib import rcParams
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from matplotlib.ticker import MultipleLocator
+
+# Columns of the progressive concept-level table
+SEGMENT_COLUMNS = [
+    'Cluster',
+    'Concept Level',
+    'Mode',
+    'Number of Questions',
+    'Accuracy (%)',
+    'Start Question Number',
+    'End Question Number',
+]
+
+
+# Function to split a learning trail (sorted by Question_Number) into runs of questions
+# with the same mode and concept level, and summarise each run in one row.
+def segment_trail(merged_df):
+    if merged_df.empty:
+        return pd.DataFrame(columns=SEGMENT_COLUMNS)
+
+    # A new segment starts wherever the mode or the concept level differs from the previous question
+    mode = merged_df['Mode']
+    level = merged_df['Concept Level']
+    changed = (mode != mode.shift()) | (level != level.shift())
+    segment_id = changed.cumsum().to_numpy()
+
+    table_df = merged_df.groupby(segment_id, sort=False).agg(**{
+        'Cluster': ('Cluster', 'first'),
+        'Concept Level': ('Concept Level', 'first'),
+        'Mode': ('Mode', 'first'),
+        'Number of Questions': ('Question_Number', 'nunique'),
+        'Accuracy (%)': ('Correctness', 'mean'),
+        'Start Question Number': ('Question_Number', 'first'),
+        'End Question Number': ('Question_Number', 'last'),
+    }).reset_index(drop=True)
+
+    # Accuracy as a percentage
+    table_df['Accuracy (%)'] = (table_df['Accuracy (%)'] * 100).round(2)
+    return table_df
+
+
+# Line colour of each mode; any other mode (Challenge) is drawn in blue
+MODE_COLORS = {'Learn': 'green', 'Remediation': 'red'}
+
+# One figure is reused for every chart instead of creating a new one per draw
+_figure = None
+_figure_lock = threading.Lock()
+
+
+# Function to draw the learning trail chart on a figure. All line pieces go into one
+# LineCollection and all Challenge markers into one scatter, so the number of artists
+# does not grow with the length of the trail.
+def draw_trail_chart(fig, question_numbers, concept_levels, modes, title):
+    question_numbers = np.asarray(question_numbers)
+    concept_levels = np.asarray(concept_levels)
+    modes = np.asarray(modes, dtype=object)
+
+    ax = fig.add_subplot()
+    ax.set_title(title)
+    ax.set_xlabel('Question Number')
+    ax.set_ylabel('Concept Level')
+    ax.yaxis.get_major_locator().set_params(integer=True)
+
+    # Set the x-axis limits based on the question number range
+    ax.set_xlim([question_numbers.min(), question_numbers.max()])
+
+    # Extend the y-axis limits based on the concept levels (adding padding) and set the major unit to 1
+    ax.set_ylim([concept_levels.min() - 1, concept_levels.max() + 1])
+    ax.yaxis.set_major_locator(MultipleLocator(1))
+
+    # Add gridlines to the plot
+    ax.grid(True)
+
+    # The line from question i-1 to question i takes the colour of the mode of question i
+    points = np.column_stack([question_numbers, concept_levels]).astype(float)
+    segments = np.stack([points[:-1], points[1:]], axis=1)
+    colors = [MODE_COLORS.get(mode, 'blue') for mode in modes[1:]]
+    # Match the width, caps and stacking of the lines ax.plot draws
+    ax.add_collection(LineCollection(segments, colors=colors, linestyle='-', zorder=2,
+                                     linewidths=rcParams['lines.linewidth'], capstyle='projecting'))
+
+    # For "Challenge" mode, add markers
+    challenge = np.flatnonzero(modes[1:] == 'Challenge') + 1
+    ax.scatter(question_numbers[challenge], concept_levels[challenge], color='blue', marker='^', s=100)
+
+    # Adding legend manually for all modes
+    ax.plot([], [], color='green', label='Learn')
+    ax.plot([], [], color='red', label='Remediation')
+    ax.scatter([], [], color='blue', marker='^', s=100, label='Challenge')
+
+    ax.legend()
+    return ax
+
+
+# Function to render the learning trail chart as PNG bytes
+def render_trail_chart_png(question_numbers, concept_levels, modes, title):
+    global _figure
+    with _figure_lock:
+        if _figure is None:
+            _figure = Figure(figsize=(10, 6))
+        _figure.clear()
+        draw_trail_chart(_figure, question_numbers, concept_levels, modes, title)
+
+        buf = BytesIO()
+        _figure.savefig(buf, format='png')
+        return buf.getvalue()
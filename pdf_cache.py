@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# Default location of the on-disk cache, next to the apps
+DEFAULT_CACHE_DIR = os.environ.get(
+    "TMB_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".tmb_cache")
+)
+
+
+# Function to hash the raw bytes of an uploaded file
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+# Function to build a cache key from the file content and the extractor that parsed it.
+# file_hash is the content hash of data when the caller has it already.
+def make_cache_key(data, extractor_name, extractor_version, file_hash=None):
+    if file_hash is None:
+        file_hash = content_hash(data)
+    return f"{extractor_name}-v{extractor_version}-{file_hash}"
+
+
+class ParsedPDFCache:
+    # Cache of extracted PDF rows, kept in memory and mirrored on local disk.
+    # Entries are JSON payloads; both tiers evict the least recently used
+    # entries once their byte budget is exceeded. The bytes on disk are counted as entries
+    # are written; the directory is only listed at startup and when it has to be trimmed.
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_memory_bytes=64 * 1024 * 1024,
+                 max_disk_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()  # key -> (payload, size in bytes)
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def _remember(self, key, payload, size):
+        # Insert into the memory tier and evict the oldest entries if over budget
+        if key in self._entries:
+            self._memory_bytes -= self._entries.pop(key)[1]
+        if size > self.max_memory_bytes:
+            return
+        self._entries[key] = (payload, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            _, (_, old_size) = self._entries.popitem(last=False)
+            self._memory_bytes -= old_size
+
+    # (access time, size, path) of every entry on disk
+    def _disk_files(self):
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    # Evict the least recently used entries on disk down to 90% of the budget, so a full
+    # cache is not listed again on every put. The count of bytes is reset from the listing,
+    # which also takes in the entries written by other processes.
+    def _trim_disk(self):
+        files = self._disk_files()
+        total = sum(size for _, size, _ in files)
+        target = self.max_disk_bytes * 0.9
+        # Oldest access time first
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+
+            if self.cache_dir:
+                path = self._path(key)
+                try:
+                    with open(path, "rb") as f:
+                        raw = f.read()
+                    payload = json.loads(raw)
+                except (OSError, ValueError):
+                    payload = None
+                if payload is not None:
+                    # Touch the file so disk eviction sees it as recently used
+                    try:
+                        os.utime(path)
+                    except OSError:
+                        pass
+                    self._remember(key, payload, len(raw))
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return payload
+
+            self.misses += 1
+            return None
+
+    def put(self, key, payload):
+        raw = json.dumps(payload).encode("utf-8")
+        with self._lock:
+            self._remember(key, payload, len(raw))
+            if self.cache_dir:
+                # Write to a temporary file first so readers never see a partial entry
+                path = self._path(key)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                try:
+                    old_size = os.path.getsize(path) if os.path.exists(path) else 0
+                    with open(tmp_path, "wb") as f:
+                        f.write(raw)
+                    os.replace(tmp_path, path)
+                    self._disk_bytes += len(raw) - old_size
+                    if self._disk_bytes > self.max_disk_bytes:
+                        self._trim_disk()
+                except OSError:
+                    pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+            self._disk_bytes = 0
+            if self.cache_dir:
+                for name in os.listdir(self.cache_dir):
+                    if name.endswith(".json"):
+                        try:
+                            os.remove(os.path.join(self.cache_dir, name))
+                        except OSError:
+                            pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "memory_bytes": self._memory_bytes,
+            }
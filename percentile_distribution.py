@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+# Upper edges of the percentile bands; each band includes its upper edge,
+# so 50 falls in the lowest band and 60.5 in 61-70
+PERCENTILE_BAND_EDGES = [50, 60, 70, 80, 90]
+
+# Dimensions the distribution cube is counted over
+CUBE_DIMENSIONS = ['School Code', 'Class', 'Subject', 'Section']
+
+
+# Function to name the percentile bands, e.g. '0-50 Percentile', '51-60 Percentile', '91-100 Percentile'
+def percentile_band_labels(band_edges=PERCENTILE_BAND_EDGES):
+    labels = [f"0-{band_edges[0]} Percentile"]
+    for low, high in zip(band_edges[:-1], band_edges[1:]):
+        labels.append(f"{low + 1}-{high} Percentile")
+    labels.append(f"{band_edges[-1] + 1}-100 Percentile")
+    return labels
+
+
+# Function to put every percentile into its band, as an ordered categorical
+def bin_percentiles(percentiles, band_edges=PERCENTILE_BAND_EDGES):
+    bins = [-np.inf] + list(band_edges) + [np.inf]
+    return pd.cut(percentiles, bins=bins, right=True, labels=percentile_band_labels(band_edges))
+
+
+# Function to count the students of every School x Class x Subject x Section x band in one pass.
+# Returns a Series indexed by those dimensions plus 'Percentile Range'.
+def build_distribution_cube(final_df, band_edges=PERCENTILE_BAND_EDGES):
+    ranges = bin_percentiles(final_df['Percentile'], band_edges).rename('Percentile Range')
+    return final_df.groupby([final_df[dim] for dim in CUBE_DIMENSIONS] + [ranges], observed=True)['Student'].count()
+
+
+# Function to roll the cube up to the given dimensions, one column per percentile band
+def distribution_view(cube, index):
+    view = cube.groupby(level=index + ['Percentile Range'], observed=True).sum().unstack('Percentile Range', fill_value=0)
+    # Keep every band as a column, in band order, even when no student falls in it
+    view = view.reindex(columns=list(cube.index.levels[-1].categories), fill_value=0)
+    view.columns.name = 'Percentile Range'
+    return view.reset_index()
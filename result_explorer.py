@@ -0,0 +1,69 @@
+from functools import reduce
+
+import numpy as np
+
+# Columns the explorer filters on, when the frame has them
+FILTER_COLUMNS = ['School Code', 'Class', 'Subject', 'Section', 'Year']
+
+# Rows per page offered by the explorer
+PAGE_SIZES = [25, 50, 100, 250]
+
+
+class GroupIndex:
+    # Row positions of every value of the filter columns of a frame, built once per frame,
+    # so a filter is an intersection of a few sorted position arrays instead of a scan of
+    # every row
+
+    def __init__(self, df, columns=FILTER_COLUMNS):
+        self.length = len(df)
+        self.positions = {
+            column: {value: np.asarray(rows) for value, rows in df.groupby(column, observed=True, sort=True).indices.items()}
+            for column in columns if column in df
+        }
+
+    @property
+    def columns(self):
+        return list(self.positions)
+
+    # Values of a column that occur in the frame, in sorted order
+    def values(self, column):
+        return list(self.positions[column])
+
+    # Sorted positions of the rows matching every filter, given as {column: [values]}.
+    # A column without values selected is not filtered on.
+    def select(self, filters):
+        selected = []
+        for column, values in filters.items():
+            if not values:
+                continue
+            groups = [self.positions[column][value] for value in values if value in self.positions[column]]
+            selected.append(np.sort(np.concatenate(groups)) if groups else np.empty(0, dtype=np.intp))
+        if not selected:
+            return np.arange(self.length)
+        return reduce(lambda a, b: np.intersect1d(a, b, assume_unique=True), selected)
+
+
+# Function to show a frame one page at a time, with filters on the columns of its group
+# index. Only the rows of the current page are sent to the browser. key keeps the widgets
+# of several explorers on one page apart.
+def show_explorer(df, index, key):
+    import streamlit as st
+
+    filters = {}
+    if index.columns:
+        filter_columns = st.columns(len(index.columns))
+        for column, container in zip(index.columns, filter_columns):
+            filters[column] = container.multiselect(column, index.values(column), key=f"{key}-filter-{column}")
+    positions = index.select(filters)
+
+    controls = st.columns([1, 1, 2])
+    page_size = controls[0].selectbox("Rows per page", PAGE_SIZES, index=1, key=f"{key}-page-size")
+    pages = max(1, -(-len(positions) // page_size))
+    # The page resets to the first one whenever the number of pages changes
+    page = controls[1].number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1, key=f"{key}-page-{pages}")
+    start = (page - 1) * page_size
+    rows = positions[start:start + page_size]
+    controls[2].caption(
+        f"Rows {start + 1}-{start + len(rows)} of {len(positions)}" if len(rows) else f"No rows of {index.length} match"
+    )
+    st.dataframe(df.iloc[rows])
@@ -0,0 +1,278 @@
+import os
+import sqlite3
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+
+from instrumentation import for_file, stage
+from skill_cube import SKILL_CUBE_CHANGES, SKILL_CUBE_DIMENSIONS, SKILL_CUBE_MEASURES
+from tmb_batch import iter_extract
+from tmb_extraction import EXTRACTORS, tmb_frames
+from tmb_schema import apply_schema, concat_frames
+
+# Default location of the results database, next to the apps
+DEFAULT_STORE_PATH = os.environ.get(
+    "TMB_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".tmb_results.sqlite")
+)
+
+# Columns (and SQLite types) of the rows each extractor produces
+ROW_COLUMNS = {
+    "percentile": [
+        ("School Code", "TEXT"),
+        ("Student", "TEXT"),
+        ("Percentile", "REAL"),
+        ("Subject", "TEXT"),
+        ("Class", "INTEGER"),
+        ("Section", "TEXT"),
+    ],
+    "skill": [
+        ("S.no", "TEXT"),
+        ("Skill", "TEXT"),
+        ("Section Performance", "REAL"),
+        ("Class Performance", "REAL"),
+        ("National Performance", "REAL"),
+        ("School Code", "TEXT"),
+        ("Subject", "TEXT"),
+        ("Class", "TEXT"),
+        ("Section", "TEXT"),
+        ("Year", "TEXT"),
+    ],
+}
+
+# SQLite limits the number of parameters of one statement
+_MAX_PARAMS = 500
+
+# Skill rows are aggregated into the cube per School x Class x Subject, over every year
+_SKILL_CUBE_GROUP = ["School Code", "Class", "Subject"]
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _chunks(values, size=_MAX_PARAMS):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+# SELECT of the skill cube cells of the skill rows matching where: the scores averaged over
+# the sections of each School x Class x Subject x Skill x Year, and their change since the
+# previous year of the same School x Class x Subject x Skill
+def _skill_cube_select(where=""):
+    dimensions = ", ".join(_quote(name) for name in SKILL_CUBE_DIMENSIONS)
+    averages = ", ".join(f"AVG({_quote(name)}) AS {_quote(name)}" for name in SKILL_CUBE_MEASURES)
+    measures = ", ".join(_quote(name) for name in SKILL_CUBE_MEASURES)
+    changes = ", ".join(f"{_quote(name)} - LAG({_quote(name)}) OVER previous_year" for name in SKILL_CUBE_MEASURES)
+    partition = ", ".join(_quote(name) for name in SKILL_CUBE_DIMENSIONS[:-1])
+    return (
+        f'SELECT {dimensions}, "Sections", {measures}, {changes} FROM ('
+        f'SELECT {dimensions}, COUNT(DISTINCT "Section") AS "Sections", {averages}'
+        f" FROM skill_rows {where} GROUP BY {dimensions})"
+        f' WINDOW previous_year AS (PARTITION BY {partition} ORDER BY "Year")'
+    )
+
+
+class ResultsStore:
+    # Persistent store of the rows extracted from each TMB, keyed by the file's content
+    # hash, so a PDF is only parsed the first time it is uploaded.
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " kind TEXT NOT NULL, file_hash TEXT NOT NULL, extractor_version INTEGER NOT NULL,"
+                " file_name TEXT, row_count INTEGER, added_at REAL,"
+                " PRIMARY KEY (kind, file_hash))"
+            )
+            for kind, columns in ROW_COLUMNS.items():
+                table = f"{kind}_rows"
+                column_sql = ", ".join(f"{_quote(name)} {sql_type}" for name, sql_type in columns)
+                conn.execute(f'CREATE TABLE IF NOT EXISTS {table} ("File Hash" TEXT NOT NULL, {column_sql})')
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_file ON {table} ("File Hash")')
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_school ON {table} ("School Code")')
+
+            # Skill scores aggregated per School x Class x Subject x Skill x Year, kept up to
+            # date as files are added, so comparisons are lookups instead of pivots of the rows
+            column_sql = ", ".join(
+                [f"{_quote(name)} TEXT" for name in SKILL_CUBE_DIMENSIONS] + ['"Sections" INTEGER']
+                + [f"{_quote(name)} REAL" for name in SKILL_CUBE_MEASURES + SKILL_CUBE_CHANGES]
+            )
+            key_sql = ", ".join(_quote(name) for name in SKILL_CUBE_DIMENSIONS)
+            conn.execute(f"CREATE TABLE IF NOT EXISTS skill_cube ({column_sql}, PRIMARY KEY ({key_sql}))")
+            conn.execute('CREATE INDEX IF NOT EXISTS skill_cube_comparison ON skill_cube ("Class", "Subject", "Year")')
+            # Stores written before the cube existed get it built from their rows once
+            if conn.execute("SELECT 1 FROM skill_cube LIMIT 1").fetchone() is None:
+                self._rebuild_skill_cube(conn)
+
+    # Open a connection that commits on success and is always closed
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # Hashes among file_hashes whose rows are stored for the current extractor version
+    def known_files(self, kind, file_hashes):
+        _, version = EXTRACTORS[kind]
+        known = set()
+        with self._connect() as conn:
+            for chunk in _chunks(list(set(file_hashes))):
+                placeholders = ", ".join("?" * len(chunk))
+                cursor = conn.execute(
+                    f"SELECT file_hash FROM files WHERE kind = ? AND extractor_version = ?"
+                    f" AND file_hash IN ({placeholders})",
+                    [kind, version] + chunk,
+                )
+                known.update(row[0] for row in cursor)
+        return known
+
+    # Store the rows of one file, replacing whatever an older extractor stored for it
+    def add_file(self, kind, file_hash, file_name, df):
+        _, version = EXTRACTORS[kind]
+        table = f"{kind}_rows"
+        names = [name for name, _ in ROW_COLUMNS[kind]]
+        values = df[names].astype(object).where(df[names].notna(), None)
+        rows = [(file_hash,) + row for row in values.itertuples(index=False, name=None)]
+
+        with self._connect() as conn:
+            if kind == "skill":
+                groups = self._skill_cube_groups(conn, file_hash)
+            conn.execute(f'DELETE FROM {table} WHERE "File Hash" = ?', (file_hash,))
+            conn.executemany(
+                f'INSERT INTO {table} VALUES ({", ".join("?" * (len(names) + 1))})', rows
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, file_hash, version, file_name, len(rows), time.time()),
+            )
+            if kind == "skill":
+                # Only the cube cells of the schools, classes and subjects of the file (before
+                # and after it was replaced) are recomputed
+                self._update_skill_cube(conn, groups | self._skill_cube_groups(conn, file_hash))
+
+    # School x Class x Subject groups of the skill rows of one file
+    def _skill_cube_groups(self, conn, file_hash):
+        columns = ", ".join(_quote(name) for name in _SKILL_CUBE_GROUP)
+        return set(conn.execute(f'SELECT DISTINCT {columns} FROM skill_rows WHERE "File Hash" = ?', (file_hash,)))
+
+    # Recompute the skill cube cells of the given School x Class x Subject groups, every year
+    def _update_skill_cube(self, conn, groups):
+        where = "WHERE " + " AND ".join(f"{_quote(name)} IS ?" for name in _SKILL_CUBE_GROUP)
+        for group in groups:
+            conn.execute(f"DELETE FROM skill_cube {where}", group)
+            conn.execute(f"INSERT INTO skill_cube {_skill_cube_select(where)}", group)
+
+    def _rebuild_skill_cube(self, conn):
+        conn.execute("DELETE FROM skill_cube")
+        conn.execute(f"INSERT INTO skill_cube {_skill_cube_select()}")
+
+    # Load the skill cube cells matching every filter, given as {column: [values]} (e.g.
+    # {"Class": ["5"], "Subject": ["Maths"]}), or all of them, with the compact column types
+    # of tmb_schema
+    def load_skill_cube(self, filters=None):
+        conditions, params = [], []
+        for column, values in (filters or {}).items():
+            values = list(dict.fromkeys(values))
+            conditions.append(f"{_quote(column)} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = ", ".join(_quote(name) for name in SKILL_CUBE_DIMENSIONS)
+        with self._connect() as conn:
+            df = pd.read_sql_query(f"SELECT * FROM skill_cube {where} ORDER BY {order}", conn, params=params)
+        return apply_schema("skill_cube", df)
+
+    # Load the stored rows of the given files, or all of them,
+    # with the compact column types of tmb_schema
+    def load(self, kind, file_hashes=None):
+        table = f"{kind}_rows"
+        names = [name for name, _ in ROW_COLUMNS[kind]]
+        select = f'SELECT "File Hash", {", ".join(_quote(name) for name in names)} FROM {table}'
+
+        with self._connect() as conn:
+            if file_hashes is None:
+                frames = [pd.read_sql_query(f"{select} ORDER BY rowid", conn)]
+            else:
+                frames = [
+                    pd.read_sql_query(
+                        f"{select} WHERE \"File Hash\" IN ({', '.join('?' * len(chunk))}) ORDER BY rowid", conn, params=chunk
+                    )
+                    for chunk in _chunks(list(dict.fromkeys(file_hashes)))
+                ]
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return apply_schema(kind, pd.DataFrame(columns=["File Hash"] + names))
+        return concat_frames(kind, frames)
+
+
+# Function to ingest uploaded (name, bytes, content hash) files one file at a time, parsing
+# only the files the store has not seen before and appending their rows (of every kind) to
+# it. items may be a lazy iterable (e.g. tmb_uploads.iter_upload_pdfs); each is looked up when
+# it is reached and new files are fed to the parser as it takes them, so only the PDFs in flight are
+# held. Yields (index, name, df, warning) as soon as each file's rows are available, in the
+# order they finish (stored files are loaded a batch at a time). df has a "File Hash" column
+# and is None when the file could not be used. A file uploaded twice is only yielded once.
+# memory_limit_mb or memory_budget, fair_share and owner bound the PDFs parsed at once (see
+# tmb_batch.iter_extract).
+def iter_ingest(store, kind, items, cache=None, pool=None, memory_limit_mb=None, memory_budget=None, fair_share=None,
+                owner=None):
+    stored = deque()  # (index, name, file hash) of stored files not yielded yet
+    new_items = []  # (index, file hash) of every file given to the parser, by position
+    seen = set()
+
+    def new_files():
+        for index, (name, pdf_bytes, file_hash) in enumerate(items):
+            with for_file(name), stage("store lookup"):
+                if file_hash in seen:
+                    continue
+                seen.add(file_hash)
+                known = store.known_files(kind, [file_hash])
+            if known:
+                stored.append((index, name, file_hash))
+            else:
+                new_items.append((index, file_hash))
+                yield name, pdf_bytes, file_hash
+
+    def load_stored():
+        batch = [stored.popleft() for _ in range(len(stored))]
+        with stage("store load"):
+            stored_df = store.load(kind, file_hashes=[file_hash for _, _, file_hash in batch])
+        frames = {file_hash: df.reset_index(drop=True) for file_hash, df in stored_df.groupby("File Hash", sort=False)}
+        for index, name, file_hash in batch:
+            # A stored file may have had no rows at all
+            yield index, name, frames[file_hash] if file_hash in frames else stored_df.iloc[:0], None
+
+    # Each new PDF is parsed once for every kind of rows, and all of them are stored, so the
+    # other app finds this file in the store too
+    parsed = iter_extract(
+        new_files(), "tmb", cache=cache, pool=pool, memory_limit_mb=memory_limit_mb, memory_budget=memory_budget,
+        fair_share=fair_share, owner=owner,
+    )
+    for position, name, result in parsed:
+        if stored:
+            yield from load_stored()
+        index, file_hash = new_items[position]
+        with for_file(name):
+            with stage("dataframe"):
+                frames = tmb_frames(name, result)
+            with stage("store write"):
+                for frame_kind, (frame_df, _) in frames.items():
+                    if frame_df is not None:
+                        store.add_file(frame_kind, file_hash, name, frame_df)
+            df, warning = frames[kind]
+            if df is None:
+                yield index, name, None, warning
+                continue
+            # Read the rows back so they have the same columns and types as the stored files
+            with stage("store load"):
+                df = store.load(kind, file_hashes=[file_hash])
+        yield index, name, df, warning
+    if stored:
+        yield from load_stored()
+
@@ -0,0 +1,34 @@
+# Dimensions of the skill cube; it has one row per School x Class x Subject x Skill x Year
+SKILL_CUBE_DIMENSIONS = ['School Code', 'Class', 'Subject', 'Skill', 'Year']
+
+# Scores averaged over the sections of a cell; Class and National Performance are the same
+# for every section of a class, so their average is the reported value
+SKILL_CUBE_MEASURES = ['Section Performance', 'Class Performance', 'National Performance']
+
+# Change of every score since the previous year stored for the same school, class, subject and skill
+SKILL_CUBE_CHANGES = [f"{measure} Change" for measure in SKILL_CUBE_MEASURES]
+
+
+# Function to lay the cube out year by year, one column per score and year, like the
+# year-wise pivot of the skill rows
+def year_comparison(cube, values=('Class Performance', 'National Performance')):
+    view = cube.set_index(SKILL_CUBE_DIMENSIONS)[list(values)].unstack('Year')
+    return view.sort_index(axis=1, level=0, sort_remaining=True).reset_index()
+
+
+# Function to compare one school with the other schools of the same class, subject and
+# year, skill by skill. cube holds the cube rows of that class, subject and year for every
+# school. Returns the school's scores, the average and rank among all schools, and the
+# gaps to that average and to the national performance.
+def school_comparison(cube, school_code):
+    cube = cube[cube['Class Performance'].notna()]
+    by_skill = cube.groupby('Skill', observed=True)['Class Performance']
+    school = cube['School Code'] == school_code
+
+    view = cube.loc[school, ['Skill', 'Class Performance', 'National Performance', 'Class Performance Change']].copy()
+    view['Rank'] = by_skill.rank(ascending=False, method='min')[school].astype('int64')
+    view['Schools'] = by_skill.transform('count')[school]
+    view['Average of Schools'] = by_skill.transform('mean')[school]
+    view['Gap to Average'] = view['Class Performance'] - view['Average of Schools']
+    view['Gap to National'] = view['Class Performance'] - view['National Performance']
+    return view.sort_values('Skill').reset_index(drop=True)
@@ -0,0 +1,13 @@
+import streamlit as st
+
+# One Streamlit process serving every tool as a page. Each page is its own script, which
+# imports its dependencies the first time the page is opened (pdfplumber for the TMB pages,
+# matplotlib for the learning trail), and all pages share the resources of app_resources.
+# The pages can still be run on their own with `streamlit run app.py` etc.
+pages = [
+    st.Page("app.py", title="Percentile distribution", default=True),
+    st.Page("app_skill.py", title="Skill summary"),
+    st.Page("app_casestudy.py", title="Learning trail"),
+]
+
+st.navigation(pages).run()
@@ -0,0 +1,179 @@
+import bisect
+import re
+import threading
+
+from pdfplumber.table import TableSettings
+from pdfplumber.utils import extract_text
+
+from instrumentation import stage
+
+# Ruling lines closer than this (in points) are treated as one, as pdfplumber's default snap/join tolerance
+RULE_TOLERANCE = 3
+
+# Templates kept per report format; a format only needs more than one if its layout changed
+MAX_TEMPLATES_PER_FORMAT = 4
+
+# Text settings pdfplumber's extract_table(s) use for the cell text
+TEXT_SETTINGS = TableSettings.resolve(None).text_settings or {}
+
+_templates = {}  # format key -> [TableTemplate]
+_templates_lock = threading.Lock()
+
+
+# Function to merge the horizontal or vertical edges of a page into ruling lines.
+# Returns (position, [(start, end), ...]) pairs, with touching segments joined.
+def _rules(edges, orientation):
+    if orientation == "h":
+        segments = sorted((edge["top"], edge["x0"], edge["x1"]) for edge in edges)
+    else:
+        segments = sorted((edge["x0"], edge["top"], edge["bottom"]) for edge in edges)
+
+    clusters = []
+    for position, start, end in segments:
+        if clusters and position - clusters[-1][0][-1] <= RULE_TOLERANCE:
+            clusters[-1][0].append(position)
+            clusters[-1][1].append((start, end))
+        else:
+            clusters.append(([position], [(start, end)]))
+
+    rules = []
+    for positions, spans in clusters:
+        joined = []
+        for start, end in sorted(spans):
+            if joined and start <= joined[-1][1] + RULE_TOLERANCE:
+                joined[-1][1] = max(joined[-1][1], end)
+            else:
+                joined.append([start, end])
+        rules.append((sum(positions) / len(positions), joined))
+    return rules
+
+
+def _covers(spans, start, end):
+    return any(a <= start + RULE_TOLERANCE and b >= end - RULE_TOLERANCE for a, b in spans)
+
+
+# Whitespace-free text of the chars inside a box, used to recognise a table header
+def _box_text(chars, x0, top, x1, bottom):
+    inside = [
+        char for char in chars
+        if x0 <= (char["x0"] + char["x1"]) / 2 < x1 and top <= (char["top"] + char["bottom"]) / 2 < bottom
+    ]
+    return re.sub(r"\s+", "", extract_text(inside, **TEXT_SETTINGS)) if inside else ""
+
+
+class TableTemplate:
+    # Column x-boundaries and header of a ruled table, learned from a page where the full
+    # detector found it. Pages of the same report format are read by cropping to these
+    # columns and bucketing the chars into the cells between the ruling lines.
+
+    def __init__(self, columns, header_height, header_text, header_rows):
+        self.columns = columns  # x of every column boundary, left to right
+        self.header_height = header_height
+        self.header_text = header_text
+        self.header_rows = header_rows  # header rows as the full detector extracted them
+
+    # Rows of the table on this page, as extract_table would return them, or None when the
+    # page does not match the template (other columns, another header or merged body cells)
+    def extract(self, page):
+        x0, x1 = self.columns[0], self.columns[-1]
+        verticals = _rules(page.vertical_edges, "v")
+
+        # The left border gives the vertical extent of the table
+        left = [span for position, spans in verticals if abs(position - x0) <= RULE_TOLERANCE for span in spans]
+        if not left:
+            return None
+        top, bottom = max(left, key=lambda span: span[1] - span[0])
+
+        ys = [
+            position for position, spans in _rules(page.horizontal_edges, "h")
+            if top - RULE_TOLERANCE <= position <= bottom + RULE_TOLERANCE and _covers(spans, x0, x1)
+        ]
+        if len(ys) < 2 or abs(ys[0] - top) > RULE_TOLERANCE:
+            return None
+        header_bottom = ys[0] + self.header_height
+        body = [y for y in ys if y >= header_bottom - RULE_TOLERANCE]
+        if len(body) < 2 or abs(body[0] - header_bottom) > RULE_TOLERANCE:
+            return None
+
+        # Every column boundary must be ruled down the whole body, so no body cell is merged
+        for x in self.columns:
+            spans = [span for position, spans in verticals if abs(position - x) <= RULE_TOLERANCE for span in spans]
+            if not _covers(spans, body[0], body[-1]):
+                return None
+
+        chars = page.chars
+        if _box_text(chars, x0, ys[0], x1, body[0]) != self.header_text:
+            return None
+
+        # Put every char into the cell holding its midpoint, like pdfplumber's Table.extract
+        cells = [[[] for _ in self.columns[1:]] for _ in body[1:]]
+        for char in chars:
+            h_mid = (char["x0"] + char["x1"]) / 2
+            v_mid = (char["top"] + char["bottom"]) / 2
+            if not (x0 <= h_mid < x1 and body[0] <= v_mid < body[-1]):
+                continue
+            row = bisect.bisect_right(body, v_mid) - 1
+            column = bisect.bisect_right(self.columns, h_mid) - 1
+            cells[row][column].append(char)
+
+        rows = [list(row) for row in self.header_rows]
+        for row in cells:
+            rows.append([extract_text(cell_chars, **TEXT_SETTINGS) if cell_chars else "" for cell_chars in row])
+        return rows
+
+
+# Function to learn a template from a table the full detector found on the page.
+# Returns None when the table cannot be read with a template (e.g. it has merged body
+# cells), which is checked by reading the page back with the new template.
+def learn_template(page, table, rows, header_rows):
+    if len(table.rows) <= header_rows:
+        return None
+    body_cells = next((row.cells for row in table.rows[header_rows:] if all(row.cells)), None)
+    if body_cells is None:
+        return None
+
+    columns = [cell[0] for cell in body_cells] + [body_cells[-1][2]]
+    top = table.bbox[1]
+    header_bottom = table.rows[header_rows].bbox[1]
+    header_text = _box_text(page.chars, columns[0], top, columns[-1], header_bottom)
+    template = TableTemplate(columns, header_bottom - top, header_text, [list(row) for row in rows[:header_rows]])
+    return template if template.extract(page) == rows else None
+
+
+# Function to extract a table of a known report format from a page. Tries the templates
+# learned for the format first and runs pdfplumber's full table detector only when none
+# of them matches, learning a template from what it finds. header_rows is the number of
+# rows above the body. With largest=True the largest table on the page is returned (like
+# page.extract_table), otherwise the first one (like page.extract_tables()[0]).
+def extract_table_with_template(page, format_key, header_rows, largest=False):
+    with _templates_lock:
+        templates = list(_templates.get(format_key, ()))
+    for template in templates:
+        with stage("table template"):
+            rows = template.extract(page)
+        if rows is not None:
+            return rows
+
+    with stage("table detector"):
+        tables = page.find_tables()
+        if not tables:
+            return None
+        if largest:
+            table = sorted(tables, key=lambda t: (-len(t.cells), t.bbox[1], t.bbox[0]))[0]
+        else:
+            table = tables[0]
+        rows = table.extract(**TEXT_SETTINGS)
+
+    template = learn_template(page, table, rows, header_rows)
+    if template is not None:
+        with _templates_lock:
+            learned = _templates.setdefault(format_key, [])
+            learned.insert(0, template)
+            del learned[MAX_TEMPLATES_PER_FORMAT:]
+    return rows
+
+
+# Function to forget every learned template
+def clear_templates():
+    with _templates_lock:
+        _templates.clear()
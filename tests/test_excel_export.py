@@ -0,0 +1,54 @@
+import io
+
+import pandas as pd
+from openpyxl import load_workbook
+
+import excel_export
+from excel_export import table_download, write_excel, write_table
+
+
+def skill_rows():
+    return pd.DataFrame({
+        "School Code": ["1001", "1001", "1002"],
+        "Skill": ["Fractions", "Fractions", "Decimals"],
+        "Year": ["2023", "2024", "2023"],
+        "Class Performance": [51.0, 55.0, 62.0],
+    })
+
+
+def test_pivot_sheets_are_written_with_one_header_row():
+    rows = skill_rows()
+    pivot = rows.pivot_table(index=["School Code", "Skill"], columns="Year", values=["Class Performance"])
+
+    workbook = load_workbook(io.BytesIO(write_excel({"Pivot": pivot, "Rows": rows}, index=True)))
+
+    header, first, *_ = workbook["Pivot"].iter_rows(values_only=True)
+    assert header == ("School Code", "Skill", "Class Performance 2023", "Class Performance 2024")
+    assert first == ("1001", "Fractions", 51, 55)
+    assert next(workbook["Rows"].iter_rows(values_only=True)) == (None, "School Code", "Skill", "Year", "Class Performance")
+
+
+def test_pivot_csv_has_one_header_row():
+    pivot = skill_rows().pivot_table(index=["School Code", "Skill"], columns="Year", values=["Class Performance"])
+
+    csv_df = pd.read_csv(io.BytesIO(write_table(pivot.reset_index(), "csv")), dtype={"School Code": str})
+
+    assert list(csv_df.columns) == ["School Code", "Skill", "Class Performance 2023", "Class Performance 2024"]
+    assert csv_df.iloc[0].tolist() == ["1001", "Fractions", 51.0, 55.0]
+
+
+def test_downloads_are_only_hashed_when_built(monkeypatch):
+    hashed = []
+    real_hash = excel_export.dataframe_hash
+    monkeypatch.setattr(excel_export, "dataframe_hash", lambda df: hashed.append(len(df)) or real_hash(df))
+    rows = skill_rows()
+
+    by_hash = table_download({"Rows": rows}, "csv")
+    by_key = table_download({"Rows": rows}, "csv", data_key="job-1")
+    assert hashed == []
+
+    assert by_hash() == by_key() == write_table(rows, "csv")
+    assert hashed == [3]
+    # The same data key gives the cached file, without hashing the data
+    assert table_download({"Rows": rows.iloc[:0]}, "csv", data_key="job-1")() == by_key()
+    assert hashed == [3]
@@ -0,0 +1,85 @@
+import io
+import time
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+import ingest_jobs
+from app_resources import get_group_index
+from ingest_jobs import DONE, FAILED, JobQueue
+from pdf_cache import content_hash
+
+
+def wait_for(job, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not job.finished:
+        assert time.monotonic() < deadline, "job did not finish"
+        time.sleep(0.01)
+
+
+def fake_rows(name):
+    return pd.DataFrame({"File Hash": [name], "School Code": [name], "Class": [1]})
+
+
+def test_failed_job_is_retried_and_indexed_again(monkeypatch):
+    runs = []
+
+    # Stands in for the results store: the first run fails on the third file
+    def fake_iter_ingest(store, kind, items, **kwargs):
+        runs.append(kind)
+        for index, (name, _, _) in enumerate(items):
+            if len(runs) == 1 and index == 2:
+                raise RuntimeError("worker died")
+            yield index, name, fake_rows(name), None
+
+    monkeypatch.setattr(ingest_jobs, "iter_ingest", fake_iter_ingest)
+    queue = JobQueue(store=None)
+    items = [(f"100{i}_M1A.pdf", f"pdf {i}".encode()) for i in range(4)]
+
+    failed = queue.submit("percentile", items, "owner")
+    wait_for(failed)
+    assert failed.status == FAILED
+    failed_df = failed.result()
+    assert len(failed_df) == 2
+    assert get_group_index(failed.id, failed_df).length == 2
+
+    retried = queue.submit("percentile", items, "owner")
+    assert retried is not failed
+    assert retried.key == failed.key and retried.id != failed.id
+    wait_for(retried)
+    assert retried.status == DONE
+
+    retried_df = retried.result()
+    index = get_group_index(retried.id, retried_df)
+    assert index.length == len(retried_df) == 4
+    np.testing.assert_array_equal(index.select({}), np.arange(4))
+    assert sorted(index.values("School Code")) == [name for name, _ in items]
+
+    # A rerun reattaches to the finished job
+    assert queue.submit("percentile", items, "owner") is retried
+
+
+def test_zip_members_are_read_by_the_job(monkeypatch):
+    def fake_iter_ingest(store, kind, items, **kwargs):
+        for index, (name, pdf_bytes, file_hash) in enumerate(items):
+            assert file_hash == content_hash(pdf_bytes)
+            yield index, name, fake_rows(bytes(pdf_bytes).decode()), None
+
+    monkeypatch.setattr(ingest_jobs, "iter_ingest", fake_iter_ingest)
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("school/1001_M1A.pdf", b"pdf 1")
+        zf.writestr("school/1002_M1A.pdf", b"pdf 2")
+        zf.writestr("__MACOSX/school/._1001_M1A.pdf", b"resource fork")
+    uploads = [("school.zip", memoryview(archive.getvalue())), ("1001_M1A.pdf", b"pdf 1"), ("notes.zip", b"not a zip")]
+
+    job = JobQueue(store=None).submit("percentile", uploads, "owner")
+    assert job.total == 3
+    wait_for(job)
+    state = job.snapshot()
+    assert state["status"] == DONE and state["done"] == 3
+    assert [row["File"] for row in state["files"]] == ["1001_M1A.pdf", "1002_M1A.pdf"]
+    assert state["skipped"][0] == "1001_M1A.pdf: duplicate of a PDF already uploaded"
+    assert state["skipped"][1].startswith("notes.zip: could not be read as a ZIP archive")
+    assert list(job.result()["School Code"]) == ["pdf 1", "pdf 2"]
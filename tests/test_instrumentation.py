@@ -0,0 +1,21 @@
+import tracemalloc
+
+from instrumentation import BatchProfile, activate, stage
+
+
+def test_tracing_runs_only_while_a_tracking_profile_is_active():
+    assert not tracemalloc.is_tracing()
+    first = BatchProfile("first", track_allocations=True, log=False)
+    second = BatchProfile("second", track_allocations=True, log=False)
+
+    with activate(first):
+        with activate(second), stage("allocate"):
+            data = [0] * 100_000
+        # The first profile is still active, so tracing goes on
+        assert tracemalloc.is_tracing()
+        with activate(BatchProfile("timings only", log=False)):
+            assert tracemalloc.is_tracing()
+    assert not tracemalloc.is_tracing()
+
+    assert second.records[0]["alloc_bytes"] > 100_000 * 4
+    del data
@@ -0,0 +1,33 @@
+import os
+
+import pdf_cache
+from pdf_cache import ParsedPDFCache
+
+listdir = os.listdir
+
+
+def disk_entries(cache_dir):
+    return sorted(name for name in listdir(cache_dir) if name.endswith(".json"))
+
+
+def test_disk_is_only_listed_at_startup_and_when_trimmed(tmp_path, monkeypatch):
+    payload = {"rows": ["x" * 1000]}
+    size = len(pdf_cache.json.dumps(payload).encode("utf-8"))
+    cache = ParsedPDFCache(str(tmp_path), max_disk_bytes=10 * size)
+
+    listings = []
+    monkeypatch.setattr(pdf_cache.os, "listdir", lambda path: listings.append(path) or listdir(path))
+    for i in range(10):
+        cache.put(f"key{i}", payload)
+    cache.put("key0", payload)  # rewriting an entry does not count it twice
+    assert listings == []
+    assert len(disk_entries(tmp_path)) == 10
+
+    cache.put("key10", payload)
+    assert len(listings) == 1
+    # Trimmed to 90% of the budget, oldest first
+    assert len(disk_entries(tmp_path)) == 9
+    assert "key10.json" in disk_entries(tmp_path)
+
+    # A new cache on the same directory counts what is there
+    assert ParsedPDFCache(str(tmp_path), max_disk_bytes=10 * size)._disk_bytes == 9 * size
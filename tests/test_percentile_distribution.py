@@ -0,0 +1,28 @@
+import pandas as pd
+
+from percentile_distribution import bin_percentiles, build_distribution_cube, distribution_view, percentile_band_labels
+
+
+def test_percentiles_fall_in_the_band_their_upper_edge_closes():
+    bands = bin_percentiles(pd.Series([0.0, 50.0, 50.5, 60.5, 90.0, 100.0]))
+
+    assert bands.astype(str).tolist() == [
+        "0-50 Percentile", "0-50 Percentile", "51-60 Percentile", "61-70 Percentile", "81-90 Percentile", "91-100 Percentile",
+    ]
+
+
+def test_distribution_view_keeps_empty_bands():
+    students = pd.DataFrame({
+        "School Code": "1001",
+        "Student": ["Asha", "Ravi", "Mina", "Arjun"],
+        "Percentile": [12.0, 50.0, 60.5, 95.0],
+        "Subject": ["Maths", "Maths", "Maths", "English"],
+        "Class": 5,
+        "Section": "A",
+    })
+
+    view = distribution_view(build_distribution_cube(students), ["Subject"]).set_index("Subject")
+
+    assert list(view.columns) == percentile_band_labels()
+    assert view.loc["Maths"].tolist() == [2, 0, 1, 0, 0, 0]
+    assert view.loc["English"].tolist() == [0, 0, 0, 0, 0, 1]
@@ -0,0 +1,49 @@
+import pandas as pd
+
+from results_store import ResultsStore
+
+
+def skill_file(school, class_code, year, section, scores, subject="Maths"):
+    return pd.DataFrame({
+        "S.no": [str(i + 1) for i in range(len(scores))],
+        "Skill": [f"Skill {i + 1}" for i in range(len(scores))],
+        "Section Performance": scores,
+        "Class Performance": [score + 1 for score in scores],
+        "National Performance": [50.0] * len(scores),
+        "School Code": school,
+        "Subject": subject,
+        "Class": class_code,
+        "Section": section,
+        "Year": year,
+    })
+
+
+def rebuilt_skill_cube(store):
+    with store._connect() as conn:
+        store._rebuild_skill_cube(conn)
+    return store.load_skill_cube()
+
+
+def test_skill_cube_kept_up_to_date_matches_a_rebuild(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+    steps = [
+        ("a", skill_file("1001", "5", "2023", "A", [40.0, 60.0])),
+        ("b", skill_file("1001", "5", "2024", "A", [45.0, 58.0])),
+        ("c", skill_file("1001", "5", "2023", "B", [50.0, 70.0])),
+        ("d", skill_file("1002", "5", "2024", "A", [30.0, 35.0, 80.0])),
+        # Replaced by a file of another class, which leaves its old cells to be recomputed
+        ("a", skill_file("1001", "6", "2023", "A", [20.0])),
+        ("e", skill_file("1001", "5", "2022", "A", [35.0, 65.0])),
+        # Added again as it was
+        ("b", skill_file("1001", "5", "2024", "A", [45.0, 58.0])),
+    ]
+
+    for file_hash, df in steps:
+        store.add_file("skill", file_hash, f"{file_hash}.pdf", df)
+        pd.testing.assert_frame_equal(store.load_skill_cube(), rebuilt_skill_cube(store))
+
+    cube = store.load_skill_cube({"School Code": ["1001"], "Class": ["5"], "Skill": ["Skill 1"]})
+    assert cube["Year"].astype(str).tolist() == ["2022", "2023", "2024"]
+    assert cube["Sections"].tolist() == [1, 1, 1]
+    assert cube["Class Performance"].tolist() == [36.0, 51.0, 46.0]
+    assert cube["Class Performance Change"].tolist()[1:] == [15.0, -5.0]
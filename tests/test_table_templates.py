@@ -0,0 +1,39 @@
+from benchmarks import synthetic_tmb
+from benchmarks.synthetic_tmb import generate_tmb
+from table_templates import TEXT_SETTINGS, learn_template
+from tmb_extraction import open_pdf
+
+PERCENTILE_PAGE = 2
+
+
+def percentile_template():
+    with open_pdf(generate_tmb(students=20, seed=1), pages=[PERCENTILE_PAGE + 1]) as pdf:
+        page = pdf.pages[0]
+        table = page.find_tables()[0]
+        template = learn_template(page, table, table.extract(**TEXT_SETTINGS), header_rows=1)
+    assert template is not None
+    return template
+
+
+def test_template_reads_the_rows_the_detector_finds_on_another_report():
+    template = percentile_template()
+
+    with open_pdf(generate_tmb("4321", students=35, seed=2), pages=[PERCENTILE_PAGE + 1]) as pdf:
+        page = pdf.pages[0]
+        rows = template.extract(page)
+        assert rows == page.find_tables()[0].extract(**TEXT_SETTINGS)
+    assert len(rows) == 37
+
+
+def test_template_does_not_match_a_table_missing_a_column_rule(monkeypatch):
+    template = percentile_template()
+    page_content = synthetic_tmb._page_content
+
+    # Leave out the ruling line between the first two columns (x = 80)
+    def without_rule(texts, tables):
+        ops = page_content(texts, tables).decode("latin-1").split("\n")
+        return "\n".join(op for op in ops if not op.startswith("80 ")).encode("latin-1")
+
+    monkeypatch.setattr(synthetic_tmb, "_page_content", without_rule)
+    with open_pdf(generate_tmb(students=20, seed=1), pages=[PERCENTILE_PAGE + 1]) as pdf:
+        assert template.extract(pdf.pages[0]) is None
@@ -0,0 +1,68 @@
+import threading
+import time
+
+import tmb_batch
+from tmb_batch import FairShare, MemoryBudget, estimate_parse_memory, iter_extract
+
+
+def test_memory_budget_is_shared_between_extractions(monkeypatch):
+    parsing = []
+    peak = []
+    lock = threading.Lock()
+
+    def fake_extract_here(extractor_name, pdf_bytes, name, profile):
+        with lock:
+            parsing.append(name)
+            peak.append(len(parsing))
+        time.sleep(0.02)
+        with lock:
+            parsing.remove(name)
+        return {"name": name}
+
+    monkeypatch.setattr(tmb_batch, "_extract_here", fake_extract_here)
+    pdf = b"x" * 1024 * 1024
+    # Room for one PDF at a time, whichever extraction it belongs to
+    budget = MemoryBudget(estimate_parse_memory(pdf) * 3 // 2 // (1024 * 1024))
+    results = {}
+
+    def extract(owner):
+        items = [(f"{owner}{i}.pdf", pdf) for i in range(4)]
+        results[owner] = [name for _, name, _ in iter_extract(items, "tmb", memory_budget=budget)]
+
+    threads = [threading.Thread(target=extract, args=(owner,)) for owner in "ab"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak) == 1
+    assert budget.used == 0
+    assert results == {owner: [f"{owner}{i}.pdf" for i in range(4)] for owner in "ab"}
+
+
+def test_memory_budget_lets_a_large_pdf_through_alone():
+    budget = MemoryBudget(1)
+    assert budget.try_reserve(10 * 1024 * 1024)
+    assert not budget.try_reserve(1)
+    budget.release(10 * 1024 * 1024)
+    assert budget.try_reserve(1)
+
+
+def test_fair_share_lends_free_slots_unless_an_owner_under_its_share_waits():
+    share = FairShare(4)
+    for owner in "abc":
+        share.join(owner)
+
+    # Nobody else is waiting, so a may go over its share of one slot
+    assert [share.try_acquire("a") for _ in range(3)] == [True, True, True]
+    assert share.try_acquire("b")
+    assert not share.try_acquire("c")
+
+    # The slot a frees goes to c, which is waiting under its share
+    share.release("a")
+    assert not share.try_acquire("a")
+    assert share.try_acquire("c")
+
+    # With every owner at its share, the slot the shares leave over is not kept idle
+    share.release("a")
+    assert share.try_acquire("b")
@@ -0,0 +1,19 @@
+import pytest
+
+from benchmarks.synthetic_tmb import generate_tmb
+from tmb_extraction import open_pdf, scan_tmb_pages
+
+
+@pytest.mark.parametrize("asset_dynamic, summary_page, year", [(False, 5, 2023), (True, 7, 2022)])
+def test_scan_finds_year_footer_format_and_summary_page(asset_dynamic, summary_page, year):
+    pdf_bytes = generate_tmb("1234", "S", 8, "B", year, asset_dynamic=asset_dynamic, summary_page=summary_page)
+
+    with open_pdf(pdf_bytes) as pdf:
+        found = scan_tmb_pages(pdf)
+
+    assert found == {
+        "year": str(year),
+        "footer": ("1234", "Science", "8", "B"),
+        "is_asset_dynamic": asset_dynamic,
+        "summary_page": summary_page - 1,
+    }
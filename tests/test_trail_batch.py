@@ -0,0 +1,29 @@
+import io
+import zipfile
+
+import pandas as pd
+
+from trail_batch import build_trail_zip
+
+
+def make_trail(questions=6):
+    return pd.DataFrame({
+        "Topic": "Fractions",
+        "Question_Number": range(1, questions + 1),
+        "Cluster": ["Concept 1", "Concept 1", "Concept 2", "Concept 2", "Concept 1", "Concept 3"][:questions],
+        "Mode": ["Learn", "Learn", "Remediation", "Remediation", "Learn", "Challenge"][:questions],
+        "Correctness": [1, 0, 1, 1, 0, 1][:questions],
+    })
+
+
+def test_a_student_that_fails_is_left_out_and_listed():
+    students = [("Asha", make_trail()), ("Ravi", make_trail().drop(columns="Topic")), ("Mina", make_trail())]
+    progress = []
+
+    data, failures = build_trail_zip(students, {"Concept 1": 1, "Concept 2": 2}, progress=lambda done, student: progress.append(student))
+
+    assert failures == [("Ravi", "KeyError: 'Topic'")]
+    assert progress == ["Asha", "Ravi", "Mina"]
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.namelist() == ["Asha.png", "Asha.xlsx", "Mina.png", "Mina.xlsx", "errors.txt"]
+        assert archive.read("errors.txt") == b"Ravi: KeyError: 'Topic'\n"
@@ -0,0 +1,289 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from instrumentation import current_profile, for_file, run_profiled, stage
+from pdf_cache import make_cache_key
+
+# Number of worker processes used when none is configured
+DEFAULT_WORKERS = int(os.environ.get("TMB_WORKERS", os.cpu_count() or 1))
+
+# Ceiling on the estimated memory of the PDFs being parsed at once, in MB (0 for no ceiling).
+# It is server configuration, like the number of workers.
+DEFAULT_MEMORY_LIMIT_MB = int(os.environ.get("TMB_MEMORY_LIMIT_MB", 2048))
+
+# Rough memory needed to parse one PDF: its size times this factor plus a fixed overhead
+# for the pdfminer objects of the pages that are touched
+PARSE_MEMORY_FACTOR = 10
+PARSE_MEMORY_OVERHEAD = 4 * 1024 * 1024
+
+
+# Function to create a pool of extraction worker processes.
+# Workers are spawned rather than forked since the Streamlit server is multi-threaded.
+def make_process_pool(workers=DEFAULT_WORKERS):
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+# Function to tell whether a pool can no longer run work because one of its worker processes
+# died (ProcessPoolExecutor then fails every submit with BrokenProcessPool)
+def pool_is_broken(pool):
+    return bool(getattr(pool, "_broken", False))
+
+
+# Function to get the number of worker processes of a pool
+def pool_workers(pool):
+    return getattr(pool, "_max_workers", DEFAULT_WORKERS)
+
+
+# Function to estimate the memory, in bytes, needed to parse one PDF
+def estimate_parse_memory(pdf_bytes):
+    return memoryview(pdf_bytes).nbytes * PARSE_MEMORY_FACTOR + PARSE_MEMORY_OVERHEAD
+
+
+# Function to run one extractor on one PDF, turning any failure into an error record
+def run_extractor(extractor_name, pdf_bytes):
+    # Imported here so the pool can be used by the learning trail tools without loading pdfplumber
+    from tmb_extraction import EXTRACTORS
+
+    extractor, _ = EXTRACTORS[extractor_name]
+    try:
+        return extractor(pdf_bytes)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+# Function to run one extractor on one PDF and also return the stage records it produced
+def run_extractor_profiled(extractor_name, pdf_bytes, track_allocations=False):
+    return run_profiled(run_extractor, extractor_name, pdf_bytes, track_allocations=track_allocations)
+
+
+# Function to run one extractor in this process, recording its stages into the profile under the file name
+def _extract_here(extractor_name, pdf_bytes, name, profile):
+    if profile is None:
+        return run_extractor(extractor_name, pdf_bytes)
+    result, records = run_extractor_profiled(extractor_name, pdf_bytes, profile.track_allocations)
+    profile.extend(name, records)
+    return result
+
+
+# Function to store a successful extraction in the cache.
+# Failures are not cached, so they are retried on the next run.
+def _remember(cache, key, result):
+    if cache is not None and "error" not in result:
+        cache.put(key, result)
+
+
+class FairShare:
+    # Shares the worker slots of one process pool between owners (e.g. the sessions of
+    # different users). While several owners have work, each may only have its equal share
+    # of the slots in flight, so one large upload cannot keep everyone else waiting. A slot
+    # left free by the shares (or by an owner with nothing more to parse) goes to an owner
+    # above its share when no owner under its share is waiting for one.
+
+    def __init__(self, slots):
+        self.slots = slots
+        self._owners = {}  # owner -> [jobs running, slots held]
+        self._waiting = set()  # owners whose last request for a slot was refused
+        self._condition = threading.Condition()
+
+    def join(self, owner):
+        with self._condition:
+            self._owners.setdefault(owner, [0, 0])[0] += 1
+
+    def leave(self, owner):
+        with self._condition:
+            entry = self._owners[owner]
+            entry[0] -= 1
+            self._forget_if_idle(owner)
+            self._condition.notify_all()
+
+    def _forget_if_idle(self, owner):
+        if self._owners[owner] == [0, 0]:
+            del self._owners[owner]
+            self._waiting.discard(owner)
+
+    def _available(self, owner):
+        held = sum(entry[1] for entry in self._owners.values())
+        if held >= self.slots:
+            return False
+        share = max(1, self.slots // len(self._owners))
+        if self._owners[owner][1] < share:
+            return True
+        return not any(other != owner and self._owners[other][1] < share for other in self._waiting)
+
+    def _take(self, owner):
+        self._owners[owner][1] += 1
+        self._waiting.discard(owner)
+
+    # Take a slot if the owner may have one, without waiting
+    def try_acquire(self, owner):
+        with self._condition:
+            if self._available(owner):
+                self._take(owner)
+                return True
+            self._waiting.add(owner)
+            return False
+
+    # Wait for a slot; only used while the owner has nothing in flight
+    def acquire(self, owner):
+        with self._condition:
+            while not self._available(owner):
+                self._waiting.add(owner)
+                self._condition.wait()
+            self._take(owner)
+
+    def release(self, owner):
+        with self._condition:
+            self._owners[owner][1] -= 1
+            self._forget_if_idle(owner)
+            self._condition.notify_all()
+
+
+class MemoryBudget:
+    # Ceiling on the estimated memory of the PDFs being parsed at once, shared by every
+    # extraction given the same budget (e.g. all the jobs of the job queue), in MB (0 for no
+    # ceiling). Memory is always granted when none is reserved, however much is asked for.
+
+    def __init__(self, limit_mb=DEFAULT_MEMORY_LIMIT_MB):
+        self.limit = limit_mb * 1024 * 1024
+        self.used = 0
+        self._condition = threading.Condition()
+
+    def _fits(self, amount):
+        return not self.limit or self.used == 0 or self.used + amount <= self.limit
+
+    # Reserve the memory if it fits, without waiting
+    def try_reserve(self, amount):
+        with self._condition:
+            if self._fits(amount):
+                self.used += amount
+                return True
+            return False
+
+    # Wait for the memory to fit; only used while the caller has nothing reserved
+    def reserve(self, amount):
+        with self._condition:
+            while not self._fits(amount):
+                self._condition.wait()
+            self.used += amount
+
+    def release(self, amount):
+        with self._condition:
+            self.used -= amount
+            self._condition.notify_all()
+
+
+# Function to wait for at least one submitted PDF to finish and yield its result
+def _collect(in_flight, cache, profile, memory_budget, fair_share=None, owner=None):
+    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+    for future in done:
+        index, name, key, memory = in_flight.pop(future)
+        memory_budget.release(memory)
+        if fair_share is not None:
+            fair_share.release(owner)
+        try:
+            result = future.result()
+            if profile is not None:
+                result, records = result
+                profile.extend(name, records)
+        except Exception as e:
+            # The worker process itself died (e.g. out of memory)
+            result = {"error": f"{type(e).__name__}: {e}"}
+        _remember(cache, key, result)
+        yield index, name, result
+
+
+# Function to extract PDFs given as an iterable of (name, bytes) pairs, yielding
+# (index, name, result) as each PDF finishes. The bytes may also be a memoryview of an
+# upload, which is only copied when it is sent to a worker process. An item may carry the
+# content hash of its bytes as a third value, which is then not computed again. Cached PDFs are not
+# re-parsed, and the rest run on the process pool when one is given. At most max_in_flight
+# PDFs (by default twice the workers of the pool) are submitted at a time, and fewer when
+# their estimated parse memory would go over the memory budget, so the items iterable can
+# read files lazily. The budget is shared with the other extractions given the same
+# MemoryBudget; without one, memory_limit_mb bounds this extraction alone. With a FairShare
+# of the pool, the owner's PDFs in flight are also kept to its share of the pool (the owner
+# must have joined). When a stage profile is active, each file's extraction stages are
+# recorded into it.
+def iter_extract(items, extractor_name, cache=None, pool=None, max_in_flight=None, memory_limit_mb=None,
+                 memory_budget=None, fair_share=None, owner=None):
+    from tmb_extraction import EXTRACTORS
+
+    _, version = EXTRACTORS[extractor_name]
+    if max_in_flight is None:
+        max_in_flight = 2 * pool_workers(pool)
+    if memory_budget is None:
+        memory_budget = MemoryBudget(DEFAULT_MEMORY_LIMIT_MB if memory_limit_mb is None else memory_limit_mb)
+    profile = current_profile()
+    in_flight = {}  # future -> (index, name, cache key, estimated parse memory)
+
+    try:
+        for index, (name, pdf_bytes, *file_hash) in enumerate(items):
+            key = None
+            if cache is not None:
+                with for_file(name), stage("cache lookup"):
+                    key = make_cache_key(pdf_bytes, extractor_name, version, *file_hash)
+                    result = cache.get(key)
+                if result is not None:
+                    yield index, name, result
+                    continue
+
+            memory = estimate_parse_memory(pdf_bytes)
+            if pool is None:
+                memory_budget.reserve(memory)
+                try:
+                    result = _extract_here(extractor_name, pdf_bytes, name, profile)
+                finally:
+                    memory_budget.release(memory)
+                _remember(cache, key, result)
+                yield index, name, result
+                continue
+
+            reserved = False
+            while in_flight:
+                if len(in_flight) < max_in_flight and memory_budget.try_reserve(memory):
+                    if fair_share is None or fair_share.try_acquire(owner):
+                        reserved = True
+                        break
+                    memory_budget.release(memory)
+                yield from _collect(in_flight, cache, profile, memory_budget, fair_share, owner)
+            if not reserved:
+                # Nothing of ours is in flight, so wait for the other extractions to free
+                # memory and for another owner to free a slot
+                memory_budget.reserve(memory)
+                if fair_share is not None:
+                    fair_share.acquire(owner)
+
+            # Memoryviews cannot be pickled, so they are copied here, one in-flight PDF at a time
+            if not isinstance(pdf_bytes, bytes):
+                pdf_bytes = bytes(pdf_bytes)
+            try:
+                if profile is None:
+                    future = pool.submit(run_extractor, extractor_name, pdf_bytes)
+                else:
+                    future = pool.submit(run_extractor_profiled, extractor_name, pdf_bytes, profile.track_allocations)
+            except Exception:
+                memory_budget.release(memory)
+                if fair_share is not None:
+                    fair_share.release(owner)
+                raise
+            in_flight[future] = (index, name, key, memory)
+
+        while in_flight:
+            yield from _collect(in_flight, cache, profile, memory_budget, fair_share, owner)
+    finally:
+        # Give back the memory and slots of PDFs still in flight when the caller stops early
+        for _, _, _, memory in in_flight.values():
+            memory_budget.release(memory)
+            if fair_share is not None:
+                fair_share.release(owner)
+
+
+# Function to extract many PDFs, given as (name, bytes) pairs.
+# Returns one result record per PDF in the original order.
+def extract_many(items, extractor_name, cache=None, pool=None):
+    results = [None] * len(items)
+    for index, _, result in iter_extract(items, extractor_name, cache=cache, pool=pool):
+        results[index] = result
+    return results
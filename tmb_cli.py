@@ -0,0 +1,143 @@
+import argparse
+import os
+import sys
+import time
+
+from pdf_cache import DEFAULT_CACHE_DIR, ParsedPDFCache
+from tmb_batch import DEFAULT_MEMORY_LIMIT_MB, DEFAULT_WORKERS, iter_extract, make_process_pool
+from tmb_extraction import FRAME_BUILDERS
+
+
+class CsvSink:
+    # Appends every batch of rows to one CSV file, writing the header once
+
+    def __init__(self, path):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._write_header = True
+
+    def write(self, df):
+        df.to_csv(self._file, header=self._write_header, index=False)
+        self._file.flush()
+        self._write_header = False
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetSink:
+    # Appends every batch of rows to one Parquet file as a new row group
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._pq = pq
+        self._path = path
+        self._writer = None
+
+    def write(self, df):
+        if self._writer is None:
+            table = self._pa.Table.from_pandas(df, preserve_index=False)
+            self._writer = self._pq.ParquetWriter(self._path, table.schema)
+        else:
+            # Later files follow the column types of the first one
+            table = self._pa.Table.from_pandas(df, schema=self._writer.schema, preserve_index=False)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+SINKS = {".csv": CsvSink, ".parquet": ParquetSink}
+
+
+# Function to list the PDFs under a directory, in a stable order
+def find_pdfs(root):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(".pdf"):
+                yield os.path.join(dirpath, filename)
+
+
+# Function to read each PDF only when the extraction is ready to take it
+def read_pdfs(paths):
+    for path in paths:
+        with open(path, "rb") as f:
+            yield path, f.read()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Extract student percentiles or skill summaries from every TMB PDF under a directory."
+    )
+    parser.add_argument("kind", choices=sorted(FRAME_BUILDERS), help="which table to extract")
+    parser.add_argument("input_dir", help="directory searched recursively for PDF files")
+    parser.add_argument("-o", "--output", required=True, help="output file, .csv or .parquet")
+    parser.add_argument("-w", "--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"number of worker processes (default {DEFAULT_WORKERS})")
+    parser.add_argument("--memory-limit", type=int, default=DEFAULT_MEMORY_LIMIT_MB, metavar="MB",
+                        help="parse fewer PDFs at once to keep their estimated memory under this (default %(default)s, 0 for none)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="directory of the parsed PDF cache (default %(default)s)")
+    parser.add_argument("--no-cache", action="store_true", help="parse every PDF even if it was parsed before")
+    args = parser.parse_args(argv)
+
+    extension = os.path.splitext(args.output)[1].lower()
+    if extension not in SINKS:
+        parser.error(f"unsupported output format {extension!r}, use one of {', '.join(SINKS)}")
+    if not os.path.isdir(args.input_dir):
+        parser.error(f"{args.input_dir} is not a directory")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    build_frame = FRAME_BUILDERS[args.kind]
+    cache = None if args.no_cache else ParsedPDFCache(cache_dir=args.cache_dir)
+
+    paths = list(find_pdfs(args.input_dir))
+    if not paths:
+        print(f"No PDF files found under {args.input_dir}", file=sys.stderr)
+        return 1
+
+    sink = SINKS[os.path.splitext(args.output)[1].lower()](args.output)
+    pool = make_process_pool(args.workers) if args.workers > 1 else None
+    start = time.perf_counter()
+    total_rows = 0
+    warnings = 0
+
+    try:
+        results = iter_extract(
+            read_pdfs(paths), args.kind, cache=cache, pool=pool, max_in_flight=2 * args.workers,
+            memory_limit_mb=args.memory_limit,
+        )
+        for done, (_, path, result) in enumerate(results, start=1):
+            relative_path = os.path.relpath(path, args.input_dir)
+            df, warning = build_frame(path, result)
+            if warning:
+                warnings += 1
+                print(f"[{done}/{len(paths)}] {relative_path}: {warning}", file=sys.stderr)
+            if df is not None and not df.empty:
+                df['Source File'] = relative_path
+                sink.write(df)
+                total_rows += len(df)
+                print(f"[{done}/{len(paths)}] {relative_path}: {len(df)} rows", file=sys.stderr)
+    finally:
+        sink.close()
+        if pool is not None:
+            pool.shutdown()
+
+    elapsed = time.perf_counter() - start
+    print(f"{len(paths)} files, {total_rows} rows, {warnings} warnings in {elapsed:.1f}s -> {args.output}",
+          file=sys.stderr)
+    if cache is not None:
+        stats = cache.stats()
+        print(f"PDF cache: {stats['hits']} hits, {stats['misses']} misses", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,348 @@
+import os
+import pdfplumber
+import pandas as pd
+import re
+from io import BufferedReader, BytesIO, RawIOBase
+from instrumentation import stage
+from table_templates import extract_table_with_template
+from tmb_schema import apply_schema
+
+# Bump when an extraction changes so cached rows are re-parsed
+PERCENTILE_EXTRACTOR_VERSION = 2
+SKILL_EXTRACTOR_VERSION = 2
+# The combined extraction changes whenever either of its parts does
+TMB_EXTRACTOR_VERSION = f"{PERCENTILE_EXTRACTOR_VERSION}.{SKILL_EXTRACTOR_VERSION}"
+
+
+def extract_subject_class(filename):
+    # Split the filename and extract the relevant part
+    parts = filename.split('_')
+    school_code=parts[0]
+    subject_code = parts[1][0]
+    class_code = int(parts[1][1:2])
+    section_code = parts[1][2]
+
+    if class_code == 1:
+        class_code = 10
+
+    # Map the subject code to the full name
+    subject_mapping = {'E': 'English', 'M': 'Maths', 'S': 'Science'}
+    subject = subject_mapping.get(subject_code, 'Unknown')
+
+    return school_code,subject, class_code, section_code
+
+class MemoryViewReader(RawIOBase):
+    # Read-only file over a memoryview (e.g. UploadedFile.getbuffer()), so an upload can be
+    # parsed without copying it into a new buffer
+
+    def __init__(self, view):
+        self.view = memoryview(view).cast("B")
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.view[self.position:self.position + len(buffer)]
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.position
+        elif whence == 2:
+            offset += len(self.view)
+        self.position = max(offset, 0)
+        return self.position
+
+    def tell(self):
+        return self.position
+
+
+# Function to open a PDF from bytes or from a memoryview of an upload, without copying it.
+# pages limits pdfplumber to the given 1-based page numbers.
+def open_pdf(pdf_bytes, pages=None):
+    if isinstance(pdf_bytes, bytes):
+        stream = BytesIO(pdf_bytes)  # Shares the bytes until written to
+    else:
+        stream = BufferedReader(MemoryViewReader(pdf_bytes))
+    return pdfplumber.open(stream, pages=pages)
+
+
+# Function to read the student names and percentiles from the table on page 3 of a TMB
+def read_percentile_rows(page):
+    # Extract the first table from the page, through the learned template when it matches
+    table = extract_table_with_template(page, "percentile", header_rows=1)
+
+    rows = []
+    # Check if any tables are found
+    if table:
+        # Iterate over the rows starting from the second row (skipping the header)
+        for row in table[1:]:
+            student_name = row[1]  # Student name is in the second column
+            percentile = row[-2]  # Percentile is the second last column
+            rows.append([student_name, percentile])
+    return rows
+
+# Function to parse the student percentile table, and the footer of the same page, of a TMB
+# from the raw PDF bytes. rows is None when the PDF has no page 3.
+def parse_percentile_pdf(pdf_bytes):
+    with stage("open"):
+        # Only page 3 is loaded; the other pages are never parsed
+        pdf = open_pdf(pdf_bytes, pages=[3])
+    with pdf:
+        if not pdf.pages:
+            return {"rows": None, "footer": None}
+        page = pdf.pages[0]
+        rows = read_percentile_rows(page)
+        footer = read_footer(page)
+        page.close()
+    return {"rows": rows, "footer": footer}
+
+
+# Single pattern for everything the skill extraction looks for in the page text.
+# The year alternatives are listed in priority order (the lowest numbered one wins).
+YEAR_PATTERNS = [
+    r"Summer 2023", r"Winter 2023",
+    r"Summer 2024", r"Winter 2024",
+    r"Summer 2022", r"Winter 2022",
+
+    # Month-year combinations
+    r"January \d{4}", r"February \d{4}", r"March \d{4}", r"April \d{4}",
+    r"May \d{4}", r"June \d{4}", r"July \d{4}", r"August \d{4}",
+    r"September \d{4}", r"October \d{4}", r"November \d{4}", r"December \d{4}"
+]
+TMB_PATTERN = re.compile(
+    "|".join(f"(?P<year{i}>{pattern})" for i, pattern in enumerate(YEAR_PATTERNS))
+    + r"|(?P<dynamic>ASSET Dynamic)"
+    + r"|(?P<summary>Skill-based Summary)"
+    + r"|(?P<footer>\d+/[A-Z]{1,2}\d{1,2}[A-Z]{1,2})"
+)
+FOOTER_PATTERN = re.compile(r"(\d+)/([A-Z]{1,2})(\d{1,2})([A-Z]{1,2})")
+
+# Map the footer subject code to the full name
+FOOTER_SUBJECTS = {
+    'E': 'English',
+    'M': 'Maths',
+    'S': 'Science',
+    'C': 'Computational Thinking',
+    'CT': 'Computational Thinking',
+    'G': 'Social Studies',
+    'H': 'Hindi',
+}
+
+YEAR_PAGE = 3  # Page 4 holds the assessment season, e.g. "Summer 2023"
+DYNAMIC_PAGE = 0  # Page 1 names the ASSET Dynamic report format
+SUMMARY_PAGES = range(4, 8)  # Page indices for pages 5 to 8
+FOOTER_HEIGHT = 50
+
+
+# Function to read school code, subject, class and section from the footer band of a page
+def read_footer(page):
+    # Define a box at the bottom of the page to extract footer text
+    footer_box = (0, page.height - FOOTER_HEIGHT, page.width, page.height)
+    with stage("footer_crop"):
+        footer_text = page.within_bbox(footer_box).extract_text()
+    if footer_text:
+        match = FOOTER_PATTERN.search(footer_text.strip())
+        if match:
+            school_code, subject_code, class_value, section = match.groups()
+            return school_code, FOOTER_SUBJECTS.get(subject_code, 'Unknown'), class_value, section
+    return None
+
+
+# Function to collect the year, footer code, ASSET Dynamic flag and "Skill-based Summary"
+# page of a TMB. Each page is visited at most once, in order, and only while something
+# is still missing: the full text is only extracted from pages 1, 4 and 5-8, and the
+# footer band is only cropped when the page text holds a footer code. The layout of every
+# page is released once the page is done, except the summary page, whose table is read next.
+def scan_tmb_pages(pdf):
+    found = {"year": None, "footer": None, "is_asset_dynamic": False, "summary_page": None}
+    year_rank = None
+
+    for i, page in enumerate(pdf.pages):
+        wants_text = i in (DYNAMIC_PAGE, YEAR_PAGE) or (i in SUMMARY_PAGES and found["summary_page"] is None)
+        if not wants_text:
+            if found["footer"] is None:
+                # Only the footer is still missing on this page
+                found["footer"] = read_footer(page)
+                page.close()
+            elif i > YEAR_PAGE:
+                # Every page that needs its text has been read
+                break
+            continue
+
+        with stage("page_text"):
+            text = page.extract_text() or ""
+        has_footer_code = False
+        for match in TMB_PATTERN.finditer(text):
+            group = match.lastgroup
+            if group.startswith("year") and i == YEAR_PAGE:
+                rank = int(group[4:])
+                if year_rank is None or rank < year_rank:
+                    year_rank = rank
+                    found["year"] = re.search(r"\d{4}", match.group(0)).group(0)
+            elif group == "dynamic" and i == DYNAMIC_PAGE:
+                found["is_asset_dynamic"] = True
+            elif group == "summary" and i in SUMMARY_PAGES and found["summary_page"] is None:
+                found["summary_page"] = i
+            elif group == "footer":
+                has_footer_code = True
+
+        if found["footer"] is None and has_footer_code:
+            found["footer"] = read_footer(page)
+        if found["summary_page"] != i:
+            page.close()
+
+    return found
+
+# Function to parse the skill summary rows and the PDF metadata from the raw PDF bytes.
+# The result only holds plain values so it can be kept in the PDF cache.
+def parse_skill_pdf(pdf_bytes):
+    with stage("open"):
+        pdf = open_pdf(pdf_bytes)
+    with pdf:
+        # Collect the year, footer info, report format and summary page in one pass
+        scan = scan_tmb_pages(pdf)
+        return read_skill_summary(pdf, scan)
+
+
+# Function to read the skill summary rows of an open TMB, given what scan_tmb_pages found
+def read_skill_summary(pdf, scan):
+    year = scan["year"]
+    if not year:
+        return {"warning": "Year not found in the PDF."}
+    
+    if scan["footer"] is None:
+        return {"warning": "School code, subject, class, or section not found in the PDF footer."}
+    school_code, subject, class_value, section = scan["footer"]
+    
+    page_number = scan["summary_page"]
+    if page_number is None:
+        return {"warning": "Skill-based Summary not found in the PDF."}
+    
+    # Extract the table from the identified page, through the template learned for
+    # this report format when it matches
+    is_asset_dynamic = scan["is_asset_dynamic"]
+    page = pdf.pages[page_number]
+    report_format = "asset_dynamic" if is_asset_dynamic else "pen_and_paper"
+    table = extract_table_with_template(page, f"skill-{report_format}", header_rows=2, largest=True)
+    page.close()
+
+    # Extract relevant rows and columns
+    if not table:
+        return {"warning": "No table found in the PDF."}
+
+    data = []
+    for row in table[2:]:
+        if row[0] is not None and is_asset_dynamic:
+            data.append([row[0], row[1], row[2], row[3], row[4]])
+        else:
+            data.append([row[0], row[1], row[3], row[4], row[5]])
+
+    return {
+        "warning": None,
+        "rows": data,
+        "school_code": school_code,
+        "subject": subject,
+        "class": class_value,
+        "section": section,
+        "year": year,
+    }
+
+
+# Function to build the percentile DataFrame of one PDF from its extraction result.
+# Returns the DataFrame (None when the PDF gave no rows) and a warning for the user (or None).
+def percentile_frame(filename, result):
+    if "error" in result:
+        return None, f"Could not read {filename} ({result['error']}), skipping this file."
+
+    rows = result["rows"]
+    if rows is None:
+        return None, f"Page 3 not found in {filename}, skipping this file."
+    if not rows:
+        return None, None
+
+    # Take school code, subject, class and section from the PDF footer, or from the filename
+    # when the footer has none
+    if result.get("footer"):
+        school_code, subject, class_value, section_code = result["footer"]
+        class_code = int(class_value)
+    else:
+        try:
+            school_code,subject, class_code, section_code = extract_subject_class(os.path.basename(filename))
+        except (IndexError, ValueError):
+            return None, f"School code, subject, class or section not found in the footer or file name of {filename}, skipping this file."
+
+    # Create a DataFrame for this PDF
+    df = pd.DataFrame({
+        'School Code' : school_code,
+        'Student': [row[0] for row in rows],
+        'Percentile': [row[1] for row in rows],
+        'Subject': subject,
+        'Class': class_code,
+        'Section': section_code
+    })
+    df = df.drop(index=0).reset_index(drop=True)
+    return apply_schema("percentile", df), None
+
+
+# Function to build the skill DataFrame of one PDF from its extraction result.
+# Returns the DataFrame (None when the PDF could not be used) and a warning for the user (or None).
+def skill_frame(filename, result):
+    if "error" in result:
+        return None, f"Could not read {filename} ({result['error']}), skipping this file."
+    if result["warning"]:
+        return None, result["warning"]
+
+    df = pd.DataFrame(result["rows"], columns=["S.no", "Skill", "Section Performance", "Class Performance", "National Performance"])
+    df['School Code'] = result["school_code"]
+    df['Subject'] = result["subject"]
+    df['Class'] = result["class"]
+    df['Section'] = result["section"]
+    df['Year'] = result["year"]  # Add the extracted year here
+    return apply_schema("skill", df), None
+
+
+# Function to parse both the student percentile table and the skill summary of a TMB, opening
+# and scanning the PDF once. The percentile rows use the footer the scan found, so both
+# outputs share one set of school code, subject, class and section.
+def parse_tmb_pdf(pdf_bytes):
+    with stage("open"):
+        pdf = open_pdf(pdf_bytes)
+    with pdf:
+        rows = None
+        if len(pdf.pages) > 2:
+            # Read page 3 before the scan, which releases the layout of the pages it visits
+            page = pdf.pages[2]
+            rows = read_percentile_rows(page)
+            page.close()
+        scan = scan_tmb_pages(pdf)
+        skill = read_skill_summary(pdf, scan)
+    return {"percentile": {"rows": rows, "footer": scan["footer"]}, "skill": skill}
+
+
+# Function to build the percentile and skill DataFrames of one PDF from its combined
+# extraction result. Returns {kind: (DataFrame or None, warning or None)}.
+def tmb_frames(filename, result):
+    if "error" in result:
+        return {kind: FRAME_BUILDERS[kind](filename, result) for kind in FRAME_BUILDERS}
+    return {kind: FRAME_BUILDERS[kind](filename, result[kind]) for kind in FRAME_BUILDERS}
+
+
+# Extractors by name, with the version used in their cache keys
+EXTRACTORS = {
+    "percentile": (parse_percentile_pdf, PERCENTILE_EXTRACTOR_VERSION),
+    "skill": (parse_skill_pdf, SKILL_EXTRACTOR_VERSION),
+    "tmb": (parse_tmb_pdf, TMB_EXTRACTOR_VERSION),
+}
+
+# Functions turning each extractor's result into a DataFrame
+FRAME_BUILDERS = {
+    "percentile": percentile_frame,
+    "skill": skill_frame,
+}
@@ -0,0 +1,44 @@
+import pandas as pd
+
+# Columns that repeat a few values on every row, stored as categoricals
+DIMENSION_COLUMNS = {
+    "percentile": ["School Code", "Subject", "Class", "Section"],
+    "skill": ["Skill", "School Code", "Subject", "Class", "Section", "Year"],
+    "skill_cube": ["School Code", "Class", "Subject", "Skill", "Year"],
+}
+
+# Columns holding scores, parsed to float32 (NaN where a value is missing or not a number)
+NUMERIC_COLUMNS = {
+    "percentile": ["Percentile"],
+    "skill": ["Section Performance", "Class Performance", "National Performance"],
+    "skill_cube": [
+        "Section Performance", "Class Performance", "National Performance",
+        "Section Performance Change", "Class Performance Change", "National Performance Change",
+    ],
+}
+
+
+# Function to parse scores such as 57, "57", "57%" or " 57.5 % " to float32; anything else becomes NaN
+def parse_scores(values):
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype("float32")
+    text = values.astype("string").str.strip().str.rstrip("%").str.strip()
+    return pd.to_numeric(text, errors="coerce").astype("float32")
+
+
+# Function to give an extracted frame its compact column types. Safe to apply again, e.g.
+# after concatenating frames whose categories differ (which turns them back into objects).
+def apply_schema(kind, df):
+    df = df.copy()
+    for column in NUMERIC_COLUMNS[kind]:
+        if column in df and df[column].dtype != "float32":
+            df[column] = parse_scores(df[column])
+    for column in DIMENSION_COLUMNS[kind]:
+        if column in df and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype("category")
+    return df
+
+
+# Function to concatenate extracted frames of one kind, keeping the compact column types
+def concat_frames(kind, frames):
+    return apply_schema(kind, pd.concat(frames, ignore_index=True))
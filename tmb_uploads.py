@@ -0,0 +1,117 @@
+import posixpath
+import struct
+import zipfile
+import zlib
+
+from pdf_cache import content_hash
+from tmb_extraction import MemoryViewReader
+
+# Size of the fixed part of a ZIP local file header, and its signature
+_LOCAL_HEADER_SIZE = 30
+_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+
+# Function to tell whether an uploaded file is a ZIP archive
+def is_zip_upload(name):
+    return name.lower().endswith(".zip")
+
+
+# Whether a ZIP member is a PDF, leaving out folders, hidden files and macOS resource forks
+def _is_pdf_member(info):
+    base = posixpath.basename(info.filename)
+    return (
+        not info.is_dir()
+        and base.lower().endswith(".pdf")
+        and not base.startswith(".")
+        and not info.filename.startswith("__MACOSX/")
+    )
+
+
+# Function to read one member of a ZIP archive held in memory. A member stored without
+# compression is returned as a memoryview into the archive, without copying it (its CRC is
+# still checked); a compressed member is inflated into bytes.
+def read_member(archive, buffer, info):
+    if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1:
+        return archive.read(info)
+
+    header = buffer[info.header_offset:info.header_offset + _LOCAL_HEADER_SIZE]
+    if len(header) < _LOCAL_HEADER_SIZE or bytes(header[:4]) != _LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad local file header for {info.filename!r}")
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    start = info.header_offset + _LOCAL_HEADER_SIZE + name_length + extra_length
+    data = buffer[start:start + info.file_size]
+    if len(data) != info.file_size or zlib.crc32(data) != info.CRC:
+        raise zipfile.BadZipFile(f"Bad CRC-32 for file {info.filename!r}")
+    return data
+
+
+# Function to read the PDFs inside a ZIP archive held in memory, one member at a time.
+# Yields (member file name, data); nothing is written to disk.
+def iter_zip_pdfs(buffer):
+    reader = MemoryViewReader(buffer)
+    buffer = reader.view
+    with zipfile.ZipFile(reader) as archive:
+        for info in archive.infolist():
+            if _is_pdf_member(info):
+                yield posixpath.basename(info.filename), read_member(archive, buffer, info)
+
+
+# Function to read the PDFs of uploaded (name, buffer) files, where a file may be a PDF or a
+# ZIP archive of PDFs (e.g. all the TMBs of a school for a year). ZIP members are read one at
+# a time as the archive is walked, and named after their file, as the apps expect TMB file
+# names. Yields (name, data, content hash); the hash is computed once here (or given in
+# upload_hashes, the content hashes of the uploads, for an uploaded PDF) and used by the
+# results store and the parsed PDF cache. A PDF whose content was already read is skipped
+# (and its data dropped straight away), so a bundle only holds each PDF once. Calls
+# skipped(name, reason) for every duplicate PDF and every archive that cannot be read.
+def iter_upload_pdfs(uploads, skipped=None, upload_hashes=None):
+    seen = set()
+
+    def skip(name, reason):
+        if skipped is not None:
+            skipped(name, reason)
+
+    def is_new(name, file_hash):
+        if file_hash in seen:
+            skip(name, "duplicate of a PDF already uploaded")
+            return False
+        seen.add(file_hash)
+        return True
+
+    for i, (name, buffer) in enumerate(uploads):
+        if not is_zip_upload(name):
+            file_hash = content_hash(buffer) if upload_hashes is None else upload_hashes[i]
+            if is_new(name, file_hash):
+                yield name, buffer, file_hash
+            continue
+
+        found = 0
+        try:
+            for member_name, data in iter_zip_pdfs(buffer):
+                found += 1
+                file_hash = content_hash(data)
+                if is_new(f"{name}/{member_name}", file_hash):
+                    yield member_name, data, file_hash
+        except (zipfile.BadZipFile, zipfile.LargeZipFile, RuntimeError, NotImplementedError) as e:
+            # RuntimeError: encrypted member; NotImplementedError: unsupported compression
+            skip(name, f"could not be read as a ZIP archive ({e})")
+            continue
+        if not found:
+            skip(name, "has no PDF files")
+
+
+# Function to count the PDFs of uploaded (name, buffer) files without reading them: a ZIP
+# archive only has its central directory read. Duplicates are counted, and an archive that
+# cannot be read counts as none.
+def count_upload_pdfs(uploads):
+    count = 0
+    for name, buffer in uploads:
+        if not is_zip_upload(name):
+            count += 1
+            continue
+        try:
+            with zipfile.ZipFile(MemoryViewReader(buffer)) as archive:
+                count += sum(1 for info in archive.infolist() if _is_pdf_member(info))
+        except (zipfile.BadZipFile, zipfile.LargeZipFile):
+            pass
+    return count
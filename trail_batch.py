@@ -0,0 +1,189 @@
+import argparse
+import os
+import re
+import sys
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+from io import BytesIO
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from excel_export import write_excel
+from learning_trail import render_trail_chart_png, segment_trail
+from tmb_batch import DEFAULT_WORKERS, make_process_pool, pool_workers
+
+
+# Function to read every sheet of a learning trail workbook with openpyxl's streaming
+# read-only reader, yielding (sheet name, DataFrame). The first row of a sheet is its header.
+def iter_workbook_sheets(source):
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            rows = worksheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            columns = [str(name) if name is not None else f"Column {i + 1}" for i, name in enumerate(header)]
+            records = [row for row in rows if any(value is not None for value in row)]
+            yield worksheet.title, pd.DataFrame.from_records(records, columns=columns)
+    finally:
+        workbook.close()
+
+
+# Function to read the students of learning trail workbooks given as (file name, file) pairs.
+# A workbook with several sheets holds one student per sheet, named after the sheet;
+# a workbook with one sheet is one student, named after the file. Yields (student, DataFrame).
+def iter_students(workbooks):
+    for file_name, source in workbooks:
+        sheets = list(iter_workbook_sheets(source))
+        stem = os.path.splitext(os.path.basename(file_name))[0]
+        for sheet_name, trail_df in sheets:
+            yield (stem if len(sheets) == 1 else sheet_name), trail_df
+
+
+# Function to list the learning trail workbooks under a directory, in a stable order
+def find_workbooks(root):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(".xlsx") and not filename.startswith("~$"):
+                yield os.path.join(dirpath, filename)
+
+
+# Function to read concept levels from a workbook laid out like the "Concept Levels"
+# download of app_casestudy.py (Concept and Concept Level columns)
+def read_concept_levels(source):
+    levels_df = pd.read_excel(source, sheet_name=0)
+    return dict(zip(levels_df['Concept'], levels_df['Concept Level']))
+
+
+# Function to build one student's chart and concept level table from their learning trail.
+# Concepts without a level get 0, the default of the level inputs. Returns the PNG and the
+# workbook bytes, and runs in worker processes.
+def build_student_outputs(student, trail_df, concept_levels):
+    topics = trail_df['Topic'].unique()
+    topic = topics[0] if len(topics) > 0 else "Topic"
+
+    concepts_df = pd.DataFrame({'Concept': trail_df['Cluster'].unique()})
+    concepts_df['Concept Level'] = [concept_levels.get(concept, 0) for concept in concepts_df['Concept']]
+
+    merged_df = pd.merge(trail_df, concepts_df, left_on='Cluster', right_on='Concept', how='left')
+    merged_df = merged_df.sort_values(by='Question_Number')
+
+    chart_png = render_trail_chart_png(
+        merged_df['Question_Number'].to_numpy(),
+        merged_df['Concept Level'].to_numpy(),
+        merged_df['Mode'].to_numpy(),
+        f"Learning trail of {student} - {topic}",
+    )
+    table_excel = write_excel({'Concept Level Table': segment_trail(merged_df)})
+    return chart_png, table_excel
+
+
+# Function to turn a student name into a file name that is safe inside a ZIP
+def _file_stem(student, used):
+    stem = re.sub(r'[\\/:*?"<>|]+', "_", str(student)).strip() or "student"
+    candidate, n = stem, 2
+    while candidate.lower() in used:
+        candidate = f"{stem} ({n})"
+        n += 1
+    used.add(candidate.lower())
+    return candidate
+
+
+# Function to build every student's chart and table, on the process pool when one is given,
+# and write them into one ZIP as "<student>.png" and "<student>.xlsx". At most max_in_flight
+# students (by default twice the workers of the pool) are submitted at a time. A student whose
+# trail cannot be built (e.g. a sheet without a Topic column) is left out, and listed with the
+# error in "errors.txt" in the ZIP. Calls progress(done, student) after each student and
+# returns the ZIP bytes and the (student, error) pairs of the students left out.
+def build_trail_zip(students, concept_levels, pool=None, max_in_flight=None, progress=None):
+    if max_in_flight is None:
+        max_in_flight = 2 * pool_workers(pool)
+    buf = BytesIO()
+    used = set()
+    failures = []
+    done = 0
+
+    # PNGs and workbooks are compressed already, so they are stored as they are
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_STORED) as archive:
+        def add(student, build):
+            nonlocal done
+            try:
+                chart_png, table_excel = build()
+            except Exception as e:
+                failures.append((student, f"{type(e).__name__}: {e}"))
+            else:
+                stem = _file_stem(student, used)
+                archive.writestr(f"{stem}.png", chart_png)
+                archive.writestr(f"{stem}.xlsx", table_excel)
+            done += 1
+            if progress is not None:
+                progress(done, student)
+
+        in_flight = {}  # future -> student
+        for student, trail_df in students:
+            if pool is None:
+                add(student, lambda: build_student_outputs(student, trail_df, concept_levels))
+                continue
+            in_flight[pool.submit(build_student_outputs, student, trail_df, concept_levels)] = student
+            while len(in_flight) >= max_in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    add(in_flight.pop(future), future.result)
+        for future in list(in_flight):
+            add(in_flight.pop(future), future.result)
+
+        if failures:
+            archive.writestr("errors.txt", "".join(f"{student}: {error}\n" for student, error in failures))
+
+    return buf.getvalue(), failures
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Build the learning trail chart and concept level table of every student into one ZIP."
+    )
+    parser.add_argument("levels", help="workbook of concept levels (Concept and Concept Level columns)")
+    parser.add_argument("inputs", nargs="+", help="learning trail workbooks, or directories searched for them")
+    parser.add_argument("-o", "--output", required=True, help="output ZIP file")
+    parser.add_argument("-w", "--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"number of worker processes (default {DEFAULT_WORKERS})")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    paths = []
+    for path in args.inputs:
+        paths.extend(find_workbooks(path) if os.path.isdir(path) else [path])
+    if not paths:
+        print("No learning trail workbooks found.", file=sys.stderr)
+        return 1
+
+    concept_levels = read_concept_levels(args.levels)
+    students = iter_students((path, path) for path in paths)
+    start = time.perf_counter()
+
+    def progress(done, student):
+        print(f"[{done}] {student}", file=sys.stderr)
+
+    if args.workers > 1:
+        with make_process_pool(args.workers) as pool:
+            data, failures = build_trail_zip(students, concept_levels, pool=pool, max_in_flight=2 * args.workers, progress=progress)
+    else:
+        data, failures = build_trail_zip(students, concept_levels, progress=progress)
+
+    with open(args.output, "wb") as f:
+        f.write(data)
+    for student, error in failures:
+        print(f"skipped {student}: {error}", file=sys.stderr)
+    print(f"{len(paths)} workbooks in {time.perf_counter() - start:.1f}s -> {args.output}"
+          + (f" ({len(failures)} students skipped, see errors.txt)" if failures else ""), file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())